@@ -0,0 +1,63 @@
+import context  # augment system path to make imports work
+from vod_converter import autotune
+
+
+def test_tuner_climbs_to_fastest_configuration(monkeypatch):
+    images_per_second = {1: 10, 2: 20, 4: 40, 8: 30}
+    clock = [0.0]
+    monkeypatch.setattr(autotune.time, 'monotonic', lambda: clock[0])
+
+    tuner = autotune.Tuner(auto=True, sample_images=1, tuning_images=100)
+    ingest = tuner.stage('ingest', workers=8)
+    transcode = tuner.stage('transcode', workers=1)
+    assert (ingest.limit, transcode.limit) == (2, 1)
+    for _ in range(200):
+        clock[0] += 1 / images_per_second[ingest.limit]
+        tuner.image_done()
+
+    assert tuner.workers() == {'ingest': 4, 'transcode': 1}
+    report = tuner.report()
+    assert report['images'] == 200
+    assert report['workers_option'] == 'ingest=4,transcode=1'
+    assert [sample['workers']['ingest'] for sample in report['tuning']] == [2, 2, 4, 8, 2]
+
+
+def test_tuner_without_auto_keeps_workers():
+    tuner = autotune.Tuner()
+    assert tuner.stage('ingest', workers=3).limit == 3
+    tuner.observe('ingest', 0.5)
+    tuner.observe('ingest', 1.5)
+    assert tuner.report()['stages'] == {'ingest': {'images': 2, 'mean_latency': 1.0}}
+
+
+def test_tuner_reports_workers_option():
+    tuner = autotune.Tuner()
+    tuner.stage('ingest', workers=7, option=lambda limit: (limit - 1) // 2)
+    tuner.stage('transcode', workers=2)
+    report = tuner.report()
+    assert report['workers'] == {'ingest': 7, 'transcode': 2}
+    assert autotune.parse_workers(report['workers_option']) == {'ingest': 3, 'transcode': 2}
+
+
+def test_tuner_measures_from_start(monkeypatch):
+    clock = [0.0]
+    monkeypatch.setattr(autotune.time, 'monotonic', lambda: clock[0])
+    tuner = autotune.Tuner()
+    tuner.start()
+    clock[0] = 3.0
+    tuner.image_done()
+    clock[0] = 4.0
+    tuner.image_done()
+    assert (tuner.report()['seconds'], tuner.report()['images_per_second']) == (4.0, 0.5)
+
+
+def test_parse_workers():
+    assert autotune.parse_workers('auto') == 'auto'
+    assert autotune.parse_workers('3') == 3
+    assert autotune.parse_workers('ingest=4, transcode=2') == {'ingest': 4, 'transcode': 2}
+    try:
+        autotune.parse_workers('ingest=0')
+    except ValueError:
+        pass
+    else:
+        assert False, "expected a positive number of workers"
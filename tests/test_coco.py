@@ -0,0 +1,71 @@
+import json
+import os
+
+import context  # augment system path to make imports work
+from vod_converter import coco
+
+
+def _image_detection(tmpdir, image_id, detections):
+    path = os.path.join(str(tmpdir), f"{image_id}.jpg")
+    with open(path, 'wb') as f:
+        f.write(b'not really a jpg')
+    return {
+        'image': {'id': image_id, 'path': path, 'segmented_path': None, 'width': 100, 'height': 50},
+        'detections': detections
+    }
+
+
+def test_coco_egest(tmpdir):
+    root = str(tmpdir.join('out'))
+    coco.COCOEgestor().egest(image_detections=iter([
+        _image_detection(tmpdir, 'a', [
+            {'label': 'person', 'left': 1, 'top': 2, 'right': 11, 'bottom': 22},
+            {'label': 'rhinoZaurus', 'left': 0, 'top': 0, 'right': 5, 'bottom': 5},
+        ]),
+        _image_detection(tmpdir, 'b', []),
+        _image_detection(tmpdir, 'c', [
+            {'label': 'car', 'left': 3, 'top': 3, 'right': 4, 'bottom': 4},
+        ]),
+    ]), root=root)
+
+    with open(f"{root}/annotations/instances.json") as f:
+        instances = json.load(f)
+    assert sorted(os.listdir(f"{root}/images")) == ['a.jpg', 'b.jpg', 'c.jpg']
+    assert os.listdir(f"{root}/annotations") == ['instances.json']
+    assert instances['images'] == [
+        {'id': 1, 'file_name': 'a.jpg', 'width': 100, 'height': 50},
+        {'id': 2, 'file_name': 'b.jpg', 'width': 100, 'height': 50},
+        {'id': 3, 'file_name': 'c.jpg', 'width': 100, 'height': 50},
+    ]
+    categories = {category['name']: category['id'] for category in instances['categories']}
+    assert categories['person'] == 1
+    assert categories['car'] == 3
+    assert categories['rhinoZaurus'] == len(categories)
+    assert [(a['id'], a['image_id'], a['category_id'], a['bbox'], a['area']) for a in instances['annotations']] == [
+        (1, 1, 1, [1, 2, 10, 20], 200),
+        (2, 1, categories['rhinoZaurus'], [0, 0, 5, 5], 25),
+        (3, 3, 3, [3, 3, 1, 1], 1),
+    ]
+
+
+def test_coco_egest_empty(tmpdir):
+    root = str(tmpdir)
+    coco.COCOEgestor(link_images=True).egest(image_detections=[], root=root)
+    with open(f"{root}/annotations/instances.json") as f:
+        assert json.load(f)['images'] == []
+
+
+def test_coco_egest_failure_leaves_no_temporary_file(tmpdir):
+    root = str(tmpdir.join('out'))
+
+    def image_detections():
+        yield _image_detection(tmpdir, 'a', [])
+        raise IOError('could not read b')
+
+    try:
+        coco.COCOEgestor().egest(image_detections=image_detections(), root=root)
+    except IOError:
+        pass
+    else:
+        assert False, "expected the error to propagate"
+    assert os.listdir(f"{root}/annotations") == []
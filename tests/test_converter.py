@@ -1,5 +1,8 @@
+import os
+import threading
+
 import context  # augment system path to make imports work
-from vod_converter import converter
+from vod_converter import autotune, converter
 
 
 def test_convert_labels():
@@ -69,3 +72,171 @@ def test_filter_images_without_labels():
                select_only_known_labels=True,
                filter_images_without_labels=True
            )
+
+
+def test_sampler_is_deterministic():
+    image_ids = [f"{i:06d}" for i in range(1000)]
+    sampled = list(converter.Sampler(fraction=0.1, seed=3).select(image_ids))
+    assert sampled == list(converter.Sampler(fraction=0.1, seed=3).select(image_ids))
+    assert 50 < len(sampled) < 150
+    assert sampled != list(converter.Sampler(fraction=0.1, seed=4).select(image_ids))
+
+
+def test_sampler_limit():
+    image_ids = [f"{i:06d}" for i in range(1000)]
+    assert list(converter.Sampler(limit=3).select(image_ids)) == image_ids[:3]
+    sampled = list(converter.Sampler(fraction=0.5, limit=10).select(image_ids))
+    assert sampled == list(converter.Sampler(fraction=0.5).select(image_ids))[:10]
+
+
+def test_sampler_select_is_lazy():
+    def candidates():
+        yield 'a'
+        yield 'b'
+        raise AssertionError("read past limit")
+
+    assert list(converter.Sampler(limit=2).select(candidates())) == ['a', 'b']
+
+
+def test_label_filter():
+    label_filter = converter.LabelFilter(expected_labels={'person': ['Pedestrian']},
+                                         select_only_known_labels=True,
+                                         filter_images_without_labels=True)
+    assert label_filter.convert('pedestrian') == 'person'
+    assert label_filter.convert('rhinoZaurus') is None
+    assert [{'label': 'Pedestrian'}] == label_filter.filter_detections([
+        {'label': 'Pedestrian'},
+        {'label': 'rhinoZaurus'}
+    ])
+    assert not label_filter.keeps_image([])
+    assert converter.LabelFilter().keeps_image([])
+    assert converter.LabelFilter().convert('rhinoZaurus') == 'rhinoZaurus'
+
+
+def test_lazy_image(tmpdir):
+    from PIL import Image
+    path = str(tmpdir.join('image.png'))
+    Image.new('RGB', (20, 10)).save(path)
+    detections = [{'label': 'person', 'left': 1, 'top': 1, 'right': 15, 'bottom': 5}]
+    image = converter.LazyImage(id='image', path=path, segmented_path=None)
+    image_detections = [{'image': image, 'detections': detections}]
+
+    converter.validate_image_detections(image_detections, check_bounds=False)
+    assert dict(image) == {'id': 'image', 'path': path, 'segmented_path': None}
+
+    converter.validate_image_detections(image_detections)
+    assert (image['width'], image['height']) == (20, 10)
+
+
+def test_lazy_image_clamps_detections(tmpdir):
+    from PIL import Image
+    path = str(tmpdir.join('image.png'))
+    Image.new('RGB', (20, 10)).save(path)
+    detections = [{'label': 'person', 'left': 1, 'top': 1, 'right': 25, 'bottom': 5}]
+    image = converter.LazyImage(id='image', path=path, segmented_path=None,
+                                on_dimensions=converter.clamp_to_image(detections))
+    assert image.needs_dimensions()
+
+    converter.validate_image_detections([{'image': image, 'detections': detections}], check_bounds=False)
+    assert not image.needs_dimensions()
+    assert (image['width'], image['height']) == (20, 10)
+    assert detections[0]['right'] == 19
+
+
+class _ListIngestor(converter.Ingestor):
+    def __init__(self, image_ids):
+        self.image_ids = image_ids
+
+    def iter_ingest(self, path, *, sampler=None, label_filter=None):
+        sampler = sampler or converter.Sampler()
+        for image_id in sampler.select(self.image_ids):
+            yield {
+                'image': {'id': image_id, 'path': f"{path}/{image_id}.png", 'segmented_path': None,
+                          'width': 100, 'height': 100},
+                'detections': [{'label': 'Pedestrian', 'left': 1, 'top': 2, 'right': 3, 'bottom': 4}]
+            }
+
+
+class _ListEgestor(converter.Egestor):
+    def expected_labels(self):
+        return {'person': ['Pedestrian']}
+
+    def egest(self, *, image_detections, root):
+        self.image_detections = []
+        for image_detection in image_detections:
+            self.image_detections.append(image_detection)
+            with open(f"{root}/{image_detection['image']['id']}.txt", 'w') as f:
+                f.write(image_detection['detections'][0]['label'])
+
+
+def test_convert_many(tmpdir):
+    egestor = _ListEgestor()
+    assert converter.convert_many(
+        sources=[('a', _ListIngestor(['1', '2'])), ('b', _ListIngestor(['3']))], to_path=str(tmpdir),
+        egestor=egestor, select_only_known_labels=False, filter_images_without_labels=False) == (True, '')
+    assert [d['image']['path'] for d in egestor.image_detections] == ['a/1.png', 'b/3.png', 'a/2.png']
+    assert egestor.image_detections[2]['detections'][0]['label'] == 'person'
+    assert sorted(os.listdir(str(tmpdir))) == ['1.txt', '2.txt', '3.txt']
+
+
+def test_convert_many_id_collisions(tmpdir):
+    egestor = _ListEgestor()
+    sources = [('a', _ListIngestor(['1', '2'])), ('b', _ListIngestor(['2']))]
+    success, msg = converter.convert_many(sources=sources, to_path=str(tmpdir), egestor=egestor,
+                                          select_only_known_labels=False, filter_images_without_labels=False)
+    assert not success
+    assert 'Image id 2 of a is also used by b' == msg
+    assert os.listdir(str(tmpdir)) == [], "nothing is written if ids collide"
+
+    assert converter.convert_many(sources=sources, to_path=str(tmpdir), egestor=egestor,
+                                  select_only_known_labels=False, filter_images_without_labels=False,
+                                  namespace_ids=True, sampler=converter.Sampler(limit=2)) == (True, '')
+    assert [d['image']['id'] for d in egestor.image_detections] == ['0-1', '1-2']
+
+
+def test_convert_many_pipelined(tmpdir):
+    class FailingEgestor(_ListEgestor):
+        def egest(self, *, image_detections, root):
+            for idx, _ in enumerate(image_detections):
+                if idx == 3:
+                    raise IOError('disk full')
+
+    ingestor = _ListIngestor([f"{idx:06d}" for idx in range(1000)])
+    threads_before = threading.active_count()
+    try:
+        converter.convert(from_path='a', ingestor=ingestor, to_path=str(tmpdir), egestor=FailingEgestor(),
+                          select_only_known_labels=False, filter_images_without_labels=False,
+                          max_inflight_images=2)
+    except IOError as e:
+        assert 'disk full' == str(e)
+    else:
+        assert False, "expected egestion error to propagate"
+    assert threading.active_count() == threads_before
+    assert os.listdir(str(tmpdir)) == []
+
+    egestor = _ListEgestor()
+    assert converter.convert_many(sources=[('a', ingestor)], to_path=str(tmpdir), egestor=egestor,
+                                  select_only_known_labels=False, filter_images_without_labels=False,
+                                  memory_budget=1, ingest_workers=3) == (True, '')
+    assert sorted(d['image']['id'] for d in egestor.image_detections) == ingestor.image_ids
+
+
+def test_convert_many_reports_reusable_workers(tmpdir):
+    class ShardableIngestor(_ListIngestor):
+        def shardable(self):
+            return True
+
+    sources = [('a', ShardableIngestor(['1', '2'])), ('b', ShardableIngestor(['3'])), ('c', _ListIngestor(['4']))]
+
+    def convert(ingest_workers):
+        tuner = autotune.Tuner()
+        assert converter.convert_many(sources=sources, to_path=str(tmpdir.join(str(ingest_workers))),
+                                      egestor=_ListEgestor(), select_only_known_labels=False,
+                                      filter_images_without_labels=False, ingest_workers=ingest_workers,
+                                      tuner=tuner) == (True, '')
+        report = tuner.report()
+        return report['workers']['ingest'], report['workers_option']
+
+    limit, workers_option = convert(3)
+    assert (limit, workers_option) == (7, 'ingest=3')
+    assert convert(autotune.parse_workers(workers_option)['ingest']) == (limit, workers_option)
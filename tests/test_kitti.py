@@ -0,0 +1,78 @@
+from concurrent.futures import ThreadPoolExecutor
+import os
+
+import context  # augment system path to make imports work
+from vod_converter import kitti
+
+
+def _write(tmpdir, name, text):
+    path = tmpdir.join(name)
+    path.write(text)
+    return str(path)
+
+
+def test_read_label_files(tmpdir):
+    paths = [
+        _write(tmpdir, '000000.txt',
+               'Car 0.00 0 -1.57 10.0 20.0 50.0 40.0 1.50 1.60 3.90 1.00 1.70 8.00 -1.50\n'
+               'Pedestrian 0.50 2 0.20 60 20 80 90 1.7 0.6 0.8 2 1.7 9 0.1 0.75\n'),
+        _write(tmpdir, '000001.txt', ''),
+        _write(tmpdir, '000002.txt', 'Cyclist 0 0 0 1 2 3 4\n\n'),
+    ]
+    with ThreadPoolExecutor(2) as executor:
+        car_and_pedestrian, nothing, cyclist = kitti.read_label_files(paths, executor=executor)
+
+    assert car_and_pedestrian == [
+        {'label': 'Car', 'left': 10.0, 'top': 20.0, 'right': 50.0, 'bottom': 40.0,
+         'truncated': 0.0, 'occluded': 0, 'alpha': -1.57, 'dimensions': [1.5, 1.6, 3.9],
+         'location': [1.0, 1.7, 8.0], 'rotation_y': -1.5},
+        {'label': 'Pedestrian', 'left': 60.0, 'top': 20.0, 'right': 80.0, 'bottom': 90.0,
+         'truncated': 0.5, 'occluded': 2, 'alpha': 0.2, 'dimensions': [1.7, 0.6, 0.8],
+         'location': [2.0, 1.7, 9.0], 'rotation_y': 0.1, 'score': 0.75},
+    ]
+    assert nothing == []
+    assert cyclist == [{'label': 'Cyclist', 'left': 1.0, 'top': 2.0, 'right': 3.0, 'bottom': 4.0}]
+    assert kitti.read_label_files(paths[2:]) == [cyclist]
+
+
+def test_convert_to_kitti_clamps_boxes_to_image(tmpdir):
+    from PIL import Image
+    from vod_converter import converter, udacity
+    from_path = str(tmpdir.join('autti'))
+    to_path = str(tmpdir.join('kitti'))
+    os.makedirs(from_path)
+    Image.new('RGB', (100, 100)).save(f"{from_path}/a.jpg")
+    with open(f"{from_path}/labels.csv", 'w') as f:
+        f.write('frame xmin ymin xmax ymax occluded label\n')
+        f.write('a.jpg 10 10 500 50 0 car\n')
+
+    assert converter.convert(from_path=from_path, ingestor=udacity.UdacityAuttiIngestor(),
+                             to_path=to_path, egestor=kitti.KITTIEgestor(),
+                             select_only_known_labels=False, filter_images_without_labels=False) == (True, '')
+    with open(f"{to_path}/training/label_2/a.txt") as f:
+        assert f.read().split()[4:8] == ['10.0', '10.0', '99', '50.0']
+
+
+def test_convert_to_kitti_appends_to_index(tmpdir):
+    from PIL import Image
+    from vod_converter import converter, udacity
+    to_path = str(tmpdir.join('kitti'))
+
+    def convert(name, image_ids):
+        from_path = str(tmpdir.join(name))
+        os.makedirs(from_path, exist_ok=True)
+        with open(f"{from_path}/labels.csv", 'w') as f:
+            f.write('frame xmin ymin xmax ymax occluded label\n')
+            for image_id in image_ids:
+                Image.new('RGB', (100, 100)).save(f"{from_path}/{image_id}.jpg")
+                f.write(f'{image_id}.jpg 10 10 50 50 0 car\n')
+        return converter.convert(from_path=from_path, ingestor=udacity.UdacityAuttiIngestor(),
+                                 to_path=to_path, egestor=kitti.KITTIEgestor(),
+                                 select_only_known_labels=False, filter_images_without_labels=False)
+
+    assert convert('a', ['000001', '000002']) == (True, '')
+    assert convert('b', ['000003']) == (True, '')
+    assert convert('a', ['000001', '000002']) == (True, '')
+    with open(f"{to_path}/train.txt") as f:
+        assert f.read().split() == ['000001', '000002', '000003']
+    assert sorted(os.listdir(f"{to_path}/training/label_2")) == ['000001.txt', '000002.txt', '000003.txt']
@@ -0,0 +1,33 @@
+import os
+
+import context  # augment system path to make imports work
+from vod_converter import converter, kitti_tracking
+
+
+def _write_sequences(root, sequences):
+    os.makedirs(f"{root}/label_02")
+    for sequence in range(sequences):
+        os.makedirs(f"{root}/image_02/{sequence:04d}")
+        with open(f"{root}/label_02/{sequence:04d}.txt", 'w') as f:
+            for frame in range(3):
+                f.write(f"{frame} 1 Car 0 0 -1.5 10.0 10.0 50.0 40.0 1.5 1.6 3.9 1.0 1.7 8.0 -1.5\n")
+
+
+def test_shards_read_disjoint_sequences(tmpdir, monkeypatch):
+    root = str(tmpdir)
+    _write_sequences(root, 6)
+    ingestor = kitti_tracking.KITTITrackingIngestor()
+    read_paths = []
+    read_track_detections = ingestor._get_track_detections
+    monkeypatch.setattr(ingestor, '_get_track_detections',
+                        lambda path: read_paths.append(path) or read_track_detections(path))
+
+    all_ids = [image_detection['image']['id'] for image_detection in ingestor.iter_ingest(root)]
+    read_paths.clear()
+    sharded_ids = [image_detection['image']['id']
+                   for shard in range(3)
+                   for image_detection in ingestor.iter_ingest(root, sampler=converter.Sampler().sharded(shard, 3))]
+
+    assert len(all_ids) == 18
+    assert sorted(sharded_ids) == sorted(all_ids)
+    assert len(read_paths) == 6, "each sequence's labels are read by a single shard"
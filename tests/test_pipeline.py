@@ -0,0 +1,46 @@
+import threading
+
+import context  # augment system path to make imports work
+from vod_converter import pipeline
+
+
+def test_bounded_buffer_applies_backpressure():
+    buffer = pipeline.BoundedBuffer(max_bytes=100, item_size=len)
+    stop = threading.Event()
+    assert buffer.put('x' * 300, stop=stop), "an oversized item is let through into an empty buffer"
+    stop.set()
+    assert not buffer.put('x', stop=stop), "a full buffer blocks until asked to stop"
+    assert buffer.get() == 'x' * 300
+
+    buffer = pipeline.BoundedBuffer(max_items=2)
+    stop = threading.Event()
+    assert buffer.put(1, stop=stop) and buffer.put(2, stop=stop)
+    putter = threading.Thread(target=buffer.put, args=(3,), kwargs={'stop': stop})
+    putter.start()
+    putter.join(0.2)
+    assert putter.is_alive()
+    assert buffer.get() == 1
+    putter.join()
+    assert [buffer.get(), buffer.get()] == [2, 3]
+
+
+def test_iter_concurrently():
+    items = pipeline.iter_concurrently([[lambda: range(0, 3), lambda: range(10, 12)], [lambda: range(20, 22)]],
+                                       max_items=1)
+    assert list(items) == [0, 20, 10, 21, 1, 11, 2]
+
+
+def test_iter_concurrently_propagates_errors_and_stops():
+    def failing():
+        yield 1
+        raise ValueError('could not read')
+
+    threads_before = threading.active_count()
+    items = pipeline.iter_concurrently([[failing, lambda: iter(int, 1)]], max_items=2)
+    try:
+        list(items)
+    except ValueError as e:
+        assert 'could not read' == str(e)
+    else:
+        assert False, "expected producer error to propagate"
+    assert threading.active_count() == threads_before
@@ -0,0 +1,93 @@
+import json
+import os
+import socket
+import threading
+
+import context  # augment system path to make imports work
+from vod_converter import converter, server
+
+
+class FakeIngestor(converter.Ingestor):
+    def __init__(self):
+        self.ingested = 0
+
+    def ingest(self, path, *, sampler=None, label_filter=None):
+        self.ingested += 1
+        return [{
+            'image': {'id': f"{path}-{idx}", 'path': f"{idx}.png", 'segmented_path': None,
+                      'width': 100, 'height': 100},
+            'detections': [{'label': 'Pedestrian', 'left': 1, 'top': 2, 'right': 3, 'bottom': 4}]
+        } for idx in range(10)]
+
+
+class FakeEgestor(converter.Egestor):
+    def __init__(self):
+        self.egested = {}
+
+    def expected_labels(self):
+        return {'person': ['pedestrian']}
+
+    def egest(self, *, image_detections, root):
+        self.egested[root] = image_detections
+
+
+def test_dataset_cache_evicts_least_recently_used():
+    ingestor = FakeIngestor()
+    size = converter.estimate_size(ingestor.ingest('a'))
+    cache = server.DatasetCache(memory_budget=2 * size)
+    for path in ['a', 'b', 'a', 'c', 'a']:
+        cache.get(from_key='fake', from_path=path, ingestor=ingestor)
+    assert [path for _, path, _ in cache.sizes()] == ['c', 'a']
+    assert ingestor.ingested == 4
+
+
+def _request(socket_path, method, path, body=None):
+    payload = json.dumps(body).encode('utf-8') if body is not None else b''
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+        client.connect(socket_path)
+        client.sendall(f"{method} {path} HTTP/1.0\r\nContent-Length: {len(payload)}\r\n\r\n".encode('utf-8')
+                       + payload)
+        response = b''
+        while True:
+            chunk = client.recv(4096)
+            if not chunk:
+                break
+            response += chunk
+    head, _, body = response.partition(b'\r\n\r\n')
+    return int(head.split()[1]), json.loads(body)
+
+
+def test_server(tmpdir):
+    ingestor = FakeIngestor()
+    egestor = FakeEgestor()
+    socket_path = os.path.join(str(tmpdir), 'server.sock')
+    conversion_server = server.make_server(ingestors={'fake': ingestor}, egestors={'fake': egestor},
+                                           socket_path=socket_path, workers=2)
+    thread = threading.Thread(target=conversion_server.serve_forever)
+    thread.start()
+    try:
+        out_path = str(tmpdir.join('out'))
+        subset_path = str(tmpdir.join('subset'))
+        request = {'from': 'fake', 'from_path': 'a', 'to': 'fake', 'to_path': out_path}
+        assert _request(socket_path, 'POST', '/convert', request) == \
+            (200, {'success': True, 'message': '', 'images': 10})
+        assert egestor.egested[out_path][0]['detections'][0]['label'] == 'person'
+
+        status, response = _request(socket_path, 'POST', '/subset', dict(request, to_path=subset_path, limit=3))
+        assert response['images'] == 3
+        assert len(egestor.egested[subset_path]) == 3
+
+        status, response = _request(socket_path, 'POST', '/stats', request)
+        assert response['source_labels'] == {'Pedestrian': 10}
+        assert ingestor.ingested == 1
+
+        status, response = _request(socket_path, 'GET', '/datasets')
+        assert [dataset['from_path'] for dataset in response['datasets']] == ['a']
+
+        assert _request(socket_path, 'POST', '/subset', request)[0] == 400
+        assert _request(socket_path, 'POST', '/evict', {})[0] == 200
+        assert _request(socket_path, 'GET', '/datasets')[1]['datasets'] == []
+    finally:
+        conversion_server.shutdown()
+        conversion_server.server_close()
+        thread.join()
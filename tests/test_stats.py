@@ -0,0 +1,51 @@
+import context  # augment system path to make imports work
+from vod_converter import stats
+
+
+def _image_detection(detections, width=100, height=50):
+    return {
+        'image': {'id': 'x', 'path': 'x.png', 'segmented_path': None, 'width': width, 'height': height},
+        'detections': detections
+    }
+
+
+def test_compute_stats():
+    result = stats.compute_stats(
+        image_detections=iter([
+            _image_detection([
+                {'label': 'Pedestrian', 'left': 0, 'top': 0, 'right': 10, 'bottom': 20},
+                {'label': 'rhinoZaurus', 'left': 10, 'top': 10, 'right': 100, 'bottom': 20},
+            ]),
+            _image_detection([
+                {'label': 'rhinoZaurus', 'left': 5, 'top': 5, 'right': 5, 'bottom': 10},
+            ]),
+            _image_detection([]),
+        ]),
+        expected_labels={'person': ['Pedestrian']},
+        select_only_known_labels=True
+    )
+    assert result['images'] == 3
+    assert result['detections'] == 3
+    assert result['images_without_labels'] == 1
+    assert result['images_without_known_labels'] == 2
+    assert result['source_labels'] == {'rhinoZaurus': 2, 'Pedestrian': 1}
+    assert result['converted_labels'] == {'person': 1}
+    assert result['unknown_labels'] == {'rhinoZaurus': 2}
+    assert result['out_of_bounds_detections'] == 1
+    assert result['images_with_out_of_bounds_detections'] == 1
+    assert result['zero_dimension_detections'] == 1
+    assert result['box_width']['count'] == 2
+    assert result['box_width']['histogram'] == {'8-16': 1, '64-128': 1}
+    assert result['box_height']['mean'] == 15
+
+
+def test_compute_stats_keeps_unknown_labels():
+    result = stats.compute_stats(
+        image_detections=[
+            _image_detection([{'label': 'rhinoZaurus', 'left': 0, 'top': 0, 'right': 1, 'bottom': 1}]),
+        ],
+        expected_labels={'person': []},
+        select_only_known_labels=False
+    )
+    assert result['converted_labels'] == {'rhinoZaurus': 1}
+    assert result['box_area']['histogram'] == {'1-2': 1}
@@ -0,0 +1,87 @@
+import threading
+
+import context  # augment system path to make imports work
+from vod_converter import converter, stream
+
+
+class FakeIngestor(converter.Ingestor):
+    def __init__(self, count, *, fail_at=None):
+        self.count = count
+        self.fail_at = fail_at
+
+    def shardable(self):
+        return True
+
+    def iter_ingest(self, path, *, sampler=None, label_filter=None):
+        image_ids = [f"{idx:06d}" for idx in range(self.count)]
+        for image_id in sampler.select(image_ids):
+            if image_id == self.fail_at:
+                raise ValueError(f"could not read {image_id}")
+            yield {
+                'image': {'id': image_id, 'path': f"{image_id}.png", 'segmented_path': None,
+                          'width': 100, 'height': 100},
+                'detections': [
+                    {'label': 'Pedestrian', 'left': 1, 'top': 2, 'right': 3, 'bottom': 4},
+                    {'label': 'rhinoZaurus', 'left': 1, 'top': 2, 'right': 3, 'bottom': 4},
+                ]
+            }
+
+
+def _stream(count=100, **kwargs):
+    return stream.RecordStream(from_path='/nowhere', ingestor=FakeIngestor(count),
+                               expected_labels={'person': ['Pedestrian']}, **kwargs)
+
+
+def test_stream_converts_labels():
+    records = list(_stream(count=5, select_only_known_labels=True))
+    assert [record['image']['id'] for record in records] == [f"{idx:06d}" for idx in range(5)]
+    assert all(record['detections'] == [{'label': 'person', 'left': 1, 'top': 2, 'right': 3, 'bottom': 4}]
+               for record in records)
+
+
+def test_stream_workers_read_every_image_once():
+    records = list(_stream(workers=4, prefetch=2))
+    assert sorted(record['image']['id'] for record in records) == [f"{idx:06d}" for idx in range(100)]
+
+
+def test_stream_shuffles_per_epoch():
+    records = _stream(shuffle_buffer=10, seed=1)
+    epoch_0 = [record['image']['id'] for record in records.iter_epoch(0)]
+    assert epoch_0 == [record['image']['id'] for record in records.iter_epoch(0)]
+    assert epoch_0 != [record['image']['id'] for record in records.iter_epoch(1)]
+    assert sorted(epoch_0) == [f"{idx:06d}" for idx in range(100)]
+
+
+def test_stream_compact():
+    records = _stream(count=1, compact=True)
+    record, = records
+    assert record.id == '000000'
+    assert list(record.boxes) == [1, 2, 3, 4, 1, 2, 3, 4]
+    assert [records.categories[label_id] for label_id in record.label_ids] == ['person', 'rhinoZaurus']
+
+
+def test_stream_limit_and_early_close():
+    threads_before = threading.active_count()
+    records = _stream(workers=3, prefetch=1, sampler=converter.Sampler(limit=7)).iter_epoch(0)
+    assert len(list(records)) == 7
+    records = _stream(workers=3, prefetch=1).iter_epoch(0)
+    next(records)
+    records.close()
+    assert threading.active_count() == threads_before
+
+
+def test_stream_limit_ignores_workers():
+    sampler = converter.Sampler(limit=7)
+    records = [record['image']['id'] for record in _stream(workers=3, sampler=sampler)]
+    assert records == [f"{idx:06d}" for idx in range(7)]
+
+
+def test_stream_propagates_errors():
+    records = stream.RecordStream(from_path='/nowhere', ingestor=FakeIngestor(10, fail_at='000005'),
+                                  expected_labels={})
+    try:
+        list(records)
+    except ValueError as e:
+        assert 'could not read 000005' in str(e)
+    else:
+        assert False, "expected ingestion error to propagate"
@@ -0,0 +1,73 @@
+import os
+
+from PIL import Image
+
+import context  # augment system path to make imports work
+from vod_converter import transcode
+
+
+def _image_detection(path):
+    return {
+        'image': {'id': 'image', 'path': path, 'segmented_path': None, 'width': 200, 'height': 100},
+        'detections': [{'label': 'car', 'left': 10.0, 'top': 10.0, 'right': 199.0, 'bottom': 50.0}]
+    }
+
+
+def test_transcode_and_resize(tmpdir):
+    path = str(tmpdir.join('image.png'))
+    Image.new('RGBA', (200, 100)).save(path)
+    transcoder = transcode.Transcoder(image_format='jpeg', max_size=40, workers=1)
+
+    image_detection, = transcoder.transcode([_image_detection(path)], out_dir=str(tmpdir))
+    image = image_detection['image']
+    assert (image['width'], image['height']) == (40, 20)
+    with Image.open(image['path']) as transcoded:
+        assert (transcoded.format, transcoded.size) == ('JPEG', (40, 20))
+    assert image_detection['detections'] == [{'label': 'car', 'left': 2.0, 'top': 2.0, 'right': 39, 'bottom': 10.0}]
+
+
+def test_transcode_resizes_segmentation_masks(tmpdir):
+    path = str(tmpdir.join('image.jpg'))
+    Image.new('RGB', (200, 100)).save(path)
+    segmented_path = str(tmpdir.join('mask.png'))
+    mask = Image.new('P', (200, 100))
+    mask.paste(3, (100, 0, 200, 100))
+    mask.save(segmented_path)
+    image_detection = dict(_image_detection(path))
+    image_detection['image'] = dict(image_detection['image'], segmented_path=segmented_path)
+    transcoder = transcode.Transcoder(max_size=40, workers=1)
+
+    image_detection, = transcoder.transcode([image_detection], out_dir=str(tmpdir))
+    with Image.open(segmented_path) as mask, Image.open(image_detection['image']['segmented_path']) as transcoded:
+        assert (transcoded.mode, transcoded.size) == ('P', (40, 20))
+        assert transcoded.getcolors() == [(count // 25, color) for count, color in mask.getcolors()]
+
+
+def test_transcode_passes_through(tmpdir):
+    path = str(tmpdir.join('image.jpg'))
+    Image.new('RGB', (200, 100)).save(path)
+    image_detection = _image_detection(path)
+
+    assert list(transcode.Transcoder(image_format='jpeg').transcode([image_detection], out_dir=str(tmpdir))) == \
+        [image_detection]
+    transcoder = transcode.Transcoder(max_size=200, workers=1)
+    assert list(transcoder.transcode([image_detection], out_dir=str(tmpdir)))[0]['image']['path'] == path
+
+
+def test_egestor_image_format_overrides_transcoder(tmpdir):
+    from vod_converter import converter, udacity, voc
+    from_path = str(tmpdir.join('autti'))
+    to_path = str(tmpdir.join('voc'))
+    tmpdir.mkdir('autti')
+    Image.new('RGB', (100, 100)).save(f"{from_path}/a.jpg")
+    with open(f"{from_path}/labels.csv", 'w') as f:
+        f.write('frame xmin ymin xmax ymax occluded label\n')
+        f.write('a.jpg 10 10 50 50 0 car\n')
+
+    assert converter.convert(from_path=from_path, ingestor=udacity.UdacityAuttiIngestor(),
+                             to_path=to_path, egestor=voc.VOCEgestor(),
+                             select_only_known_labels=False, filter_images_without_labels=False,
+                             transcoder=transcode.Transcoder(image_format='png', workers=1)) == (True, '')
+    assert os.listdir(f"{to_path}/VOC2012/JPEGImages") == ['a.jpg']
+    with Image.open(f"{to_path}/VOC2012/JPEGImages/a.jpg") as image:
+        assert image.format == 'JPEG'
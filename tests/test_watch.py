@@ -0,0 +1,60 @@
+import os
+
+from PIL import Image
+
+import context  # augment system path to make imports work
+from vod_converter import kitti, udacity, watch
+
+
+def _add_frame(root, image_id, labels, *, mtime_ns=None):
+    Image.new('RGB', (100, 50)).save(f"{root}/training/image_2/{image_id}.png")
+    labels_path = f"{root}/training/label_2/{image_id}.txt"
+    with open(labels_path, 'w') as f:
+        f.write(labels)
+    if mtime_ns is not None:
+        os.utime(labels_path, ns=(mtime_ns, mtime_ns))
+    with open(f"{root}/train.txt", 'a') as f:
+        f.write(f"{image_id}\n")
+
+
+def _watch(from_path, to_path):
+    return watch.watch(from_path=from_path, ingestor=kitti.KITTIIngestor(), to_path=to_path,
+                       egestor=kitti.KITTIEgestor(), select_only_known_labels=False,
+                       filter_images_without_labels=False, poll_interval=0, max_polls=2)
+
+
+def test_watch_converts_new_and_changed_frames(tmpdir):
+    from_path = str(tmpdir.join('from'))
+    to_path = str(tmpdir.join('to'))
+    for subdir in ['training/image_2', 'training/label_2']:
+        os.makedirs(f"{from_path}/{subdir}")
+
+    _add_frame(from_path, '000000', 'Car 0 0 0 1 2 3 4\n', mtime_ns=10 ** 9)
+    _add_frame(from_path, '000001', 'Car 0 0 0 1 2 3 4\n', mtime_ns=10 ** 9)
+    assert _watch(from_path, to_path) == (True, '')
+    with open(f"{to_path}/train.txt") as f:
+        assert f.read() == '000000\n000001\n'
+
+    _add_frame(from_path, '000002', 'Car 0 0 0 1 2 3 4\n')
+    with open(f"{from_path}/training/label_2/000000.txt", 'w') as f:
+        f.write('Pedestrian 0 0 0 1 2 3 4\n')
+    assert _watch(from_path, to_path) == (True, '')
+
+    with open(f"{to_path}/train.txt") as f:
+        assert f.read() == '000000\n000001\n000002\n'
+    with open(f"{to_path}/training/label_2/000000.txt") as f:
+        assert f.read().startswith('Pedestrian ')
+    assert os.path.isfile(f"{to_path}/training/image_2/000002.png")
+    assert not [name for name in os.listdir(to_path) if name.startswith('.watch-')]
+
+
+def test_watch_requires_watch_index(tmpdir):
+    root = str(tmpdir.join('autti'))
+    os.makedirs(root)
+    with open(f"{root}/labels.csv", 'w') as f:
+        f.write('frame xmin ymin xmax ymax occluded label\n')
+    success, msg = watch.watch(from_path=root, ingestor=udacity.UdacityAuttiIngestor(),
+                               to_path=str(tmpdir.join('out')), egestor=kitti.KITTIEgestor(),
+                               select_only_known_labels=False, filter_images_without_labels=False, max_polls=1)
+    assert not success
+    assert 'does not support watching' in msg
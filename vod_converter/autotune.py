@@ -0,0 +1,223 @@
+"""
+Chooses how many ingest threads and transcode processes a conversion uses, by measuring it.
+
+Stages start as many workers as they may ever use, but a `Throttle` limits how many are active at a time. With
+`Tuner(auto=True)`, throughput is measured over every `sample_images` images during the first `tuning_images`
+images of the run. Each stage's limit is doubled while that improves images per second, then halved while that
+improves it, one stage after another. The best configuration found is kept for the rest of the run.
+
+Either way, `Tuner.report` summarizes the run, including the configuration used, which can be passed to
+`--workers` on later runs, e.g 'ingest=4,transcode=2'.
+"""
+import threading
+import time
+
+# stages whose workers can be tuned, as named in `--workers`
+STAGES = ['ingest', 'transcode']
+
+# how much faster a configuration has to be to count as an improvement, given measurement noise
+MIN_IMPROVEMENT = 1.05
+
+
+class Throttle:
+    """
+    Limits how many threads may be in a section at a time, to a limit that may change at any time.
+
+        with throttle:
+            ...
+    """
+
+    def __init__(self, limit, *, max_limit=None):
+        self._limit = limit
+        self.max_limit = limit if max_limit is None else max_limit
+        self._active = 0
+        self._condition = threading.Condition()
+
+    @property
+    def limit(self):
+        return self._limit
+
+    @limit.setter
+    def limit(self, limit):
+        with self._condition:
+            self._limit = limit
+            self._condition.notify_all()
+
+    def __enter__(self):
+        with self._condition:
+            while self._active >= self._limit:
+                self._condition.wait()
+            self._active += 1
+
+    def __exit__(self, *exc_info):
+        with self._condition:
+            self._active -= 1
+            self._condition.notify_all()
+
+
+class Tuner:
+    """
+    Measures a conversion's throughput and stage latencies and, if auto, tunes its stages' `Throttle`s.
+
+    :param auto: whether to tune, rather than to keep every stage at its number of workers
+    :param sample_images: how many images to measure throughput over
+    :param tuning_images: stop tuning after this many images
+    """
+
+    def __init__(self, *, auto=False, sample_images=32, tuning_images=1024):
+        self.auto = auto
+        self.sample_images = sample_images
+        self.tuning_images = tuning_images
+        self.throttles = {}
+        self.history = []
+        self._options = {}
+        self._latencies = {}
+        self._lock = threading.Lock()
+        self._images = 0
+        self._started_at = None
+        self._sampled_at = None
+        self._plan = None
+        self._tuning = auto
+
+    def stage(self, name, *, workers, option=None):
+        """
+        Register a stage running up to `workers` workers.
+
+        :param option: function mapping the stage's limit to the number of workers to pass to `--workers` for it,
+            if they differ, e.g because `--workers` counts ingest workers per source
+        :return: `Throttle` limiting how many of its workers are active
+        """
+        throttle = Throttle(max(1, workers // 4) if self.auto else workers, max_limit=workers)
+        self.throttles[name] = throttle
+        if option is not None:
+            self._options[name] = option
+        return throttle
+
+    def start(self):
+        """
+        Start measuring the run, otherwise started by the first `image_done`.
+        """
+        self._started_at = self._sampled_at = time.monotonic()
+
+    def observe(self, stage, seconds):
+        """
+        Record that a stage took seconds for an image. Thread safe.
+        """
+        with self._lock:
+            count, total = self._latencies.get(stage, (0, 0.0))
+            self._latencies[stage] = (count + 1, total + seconds)
+
+    def image_done(self):
+        """
+        Record that an image made it through the last stage, tuning as due. To be called from a single thread.
+        """
+        now = time.monotonic()
+        if self._started_at is None:
+            self._started_at = self._sampled_at = now
+        self._images += 1
+        if not self._tuning or self._images % self.sample_images or self._images > self.tuning_images:
+            return
+        rate = self.sample_images / max(now - self._sampled_at, 1e-9)
+        self._sampled_at = now
+        self.history.append({'workers': self.workers(), 'images_per_second': rate})
+        self._step(rate)
+        if self._images + self.sample_images > self.tuning_images:
+            self._settle()
+
+    def workers(self):
+        """
+        :return: dict of stage name to how many of its workers are active
+        """
+        return {name: throttle.limit for name, throttle in self.throttles.items()}
+
+    def report(self):
+        """
+        :return: JSON serializable summary of the run
+        """
+        seconds = time.monotonic() - self._started_at if self._started_at is not None else 0.0
+        workers = self.workers()
+        options = {name: self._options[name](limit) if name in self._options else limit
+                   for name, limit in workers.items()}
+        return {
+            'auto': self.auto,
+            'images': self._images,
+            'seconds': seconds,
+            'images_per_second': self._images / seconds if seconds else None,
+            'workers': workers,
+            'workers_option': format_workers(options),
+            'stages': {stage: {'images': count, 'mean_latency': total / count}
+                       for stage, (count, total) in self._latencies.items()},
+            'tuning': self.history,
+        }
+
+    def _step(self, rate):
+        """
+        Hill climb: keep the current trial if it beat the best configuration so far, then move on to the next.
+        """
+        if self._plan is None:
+            # the first sample includes start up costs, the second is the baseline
+            self._plan = {'best': None, 'best_rate': 0.0, 'stages': self._tunable_stages(), 'direction': 2}
+            return
+        plan = self._plan
+        if plan['best'] is None or rate > plan['best_rate'] * MIN_IMPROVEMENT:
+            plan['best'], plan['best_rate'] = self.workers(), rate
+        else:
+            self._apply(plan['best'])
+            if plan['direction'] == 2 and plan['stages']:
+                plan['direction'] = 0.5
+            elif plan['stages']:
+                plan['stages'].pop(0)
+                plan['direction'] = 2
+
+        while plan['stages']:
+            throttle = self.throttles[plan['stages'][0]]
+            limit = min(throttle.max_limit, max(1, int(throttle.limit * plan['direction'])))
+            if limit != throttle.limit:
+                throttle.limit = limit
+                return
+            if plan['direction'] == 2:
+                plan['direction'] = 0.5
+            else:
+                plan['stages'].pop(0)
+                plan['direction'] = 2
+        self._settle()
+
+    def _settle(self):
+        if self._plan is not None and self._plan['best'] is not None:
+            self._apply(self._plan['best'])
+        self._tuning = False
+
+    def _apply(self, workers):
+        for name, limit in workers.items():
+            self.throttles[name].limit = limit
+
+    def _tunable_stages(self):
+        return [name for name, throttle in self.throttles.items() if throttle.max_limit > 1]
+
+
+def parse_workers(value):
+    """
+    Parse a `--workers` option: 'auto', a number of workers for every stage, or e.g 'ingest=4,transcode=2'.
+
+    :return: 'auto', an int, or a dict of stage name to number of workers
+    """
+    if value == 'auto':
+        return value
+    if '=' not in value:
+        return _positive(value)
+    workers = {}
+    for part in value.split(','):
+        name, _, count = part.partition('=')
+        workers[name.strip()] = _positive(count)
+    return workers
+
+
+def format_workers(workers):
+    return ','.join(f"{name}={count}" for name, count in workers.items())
+
+
+def _positive(value):
+    count = int(value)
+    if count < 1:
+        raise ValueError(f"Expected a positive number of workers, got {value}")
+    return count
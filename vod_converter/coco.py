@@ -0,0 +1,190 @@
+"""
+Egestor for COCO object detection format.
+
+http://cocodataset.org/#format-data
+
+Writes images to `images/` and a single `annotations/instances.json`. The `images` and `annotations` arrays are
+written out as image detections stream through (annotations via a temporary file that is appended at the end),
+so memory use does not grow with the size of the dataset.
+
+Category ids are assigned in order of `expected_labels`, starting at 1, rather than using the original
+(non-contiguous) COCO ids.
+"""
+
+import json
+import os
+import shutil
+import tempfile
+
+from converter import Egestor
+
+
+class COCOEgestor(Egestor):
+
+    def __init__(self, *, link_images=False):
+        """
+        :param link_images: hard link images into the output rather than copying them, where possible
+        """
+        self.link_images = link_images
+
+    def expected_labels(self):
+        return {
+            'person': ['pedestrian'],
+            'bicycle': [],
+            'car': [],
+            'motorcycle': ['motorbike'],
+            'airplane': ['aeroplane'],
+            'bus': [],
+            'train': [],
+            'truck': [],
+            'boat': [],
+            'traffic light': ['trafficlight'],
+            'fire hydrant': [],
+            'stop sign': [],
+            'parking meter': [],
+            'bench': [],
+            'bird': [],
+            'cat': [],
+            'dog': [],
+            'horse': [],
+            'sheep': [],
+            'cow': [],
+            'elephant': [],
+            'bear': [],
+            'zebra': [],
+            'giraffe': [],
+            'backpack': [],
+            'umbrella': [],
+            'handbag': [],
+            'tie': [],
+            'suitcase': [],
+            'frisbee': [],
+            'skis': [],
+            'snowboard': [],
+            'sports ball': [],
+            'kite': [],
+            'baseball bat': [],
+            'baseball glove': [],
+            'skateboard': [],
+            'surfboard': [],
+            'tennis racket': [],
+            'bottle': [],
+            'wine glass': [],
+            'cup': [],
+            'fork': [],
+            'knife': [],
+            'spoon': [],
+            'bowl': [],
+            'banana': [],
+            'apple': [],
+            'sandwich': [],
+            'orange': [],
+            'broccoli': [],
+            'carrot': [],
+            'hot dog': [],
+            'pizza': [],
+            'donut': [],
+            'cake': [],
+            'chair': [],
+            'couch': ['sofa'],
+            'potted plant': ['pottedplant'],
+            'bed': [],
+            'dining table': ['diningtable'],
+            'toilet': [],
+            'tv': ['tvmonitor'],
+            'laptop': [],
+            'mouse': [],
+            'remote': [],
+            'keyboard': [],
+            'cell phone': [],
+            'microwave': [],
+            'oven': [],
+            'toaster': [],
+            'sink': [],
+            'refrigerator': [],
+            'book': [],
+            'clock': [],
+            'vase': [],
+            'scissors': [],
+            'teddy bear': [],
+            'hair drier': [],
+            'toothbrush': [],
+        }
+
+    def egest(self, *, image_detections, root):
+        images_dir = f"{root}/images"
+        annotations_dir = f"{root}/annotations"
+        for to_create in [images_dir, annotations_dir]:
+            os.makedirs(to_create, exist_ok=True)
+
+        category_ids = {label: idx for idx, label in enumerate(self.expected_labels(), start=1)}
+        out_path = f"{annotations_dir}/instances.json"
+        tmp_out_path = f"{out_path}.tmp"
+
+        try:
+            with open(tmp_out_path, 'w') as out_file, \
+                    tempfile.TemporaryFile('w+', dir=annotations_dir) as annotations_file:
+                out_file.write('{"images": [')
+                annotation_id = 0
+                for image_id, image_detection in enumerate(image_detections, start=1):
+                    image = image_detection['image']
+                    src_extension = image['path'].split('.')[-1]
+                    file_name = f"{image['id']}.{src_extension}"
+                    self._write_image(image['path'], f"{images_dir}/{file_name}")
+
+                    _write_array_item(out_file, image_id, {
+                        'id': image_id,
+                        'file_name': file_name,
+                        'width': image['width'],
+                        'height': image['height'],
+                    })
+
+                    for detection in image_detection['detections']:
+                        annotation_id += 1
+                        label = detection['label']
+                        if label not in category_ids:
+                            category_ids[label] = len(category_ids) + 1
+                        width = detection['right'] - detection['left']
+                        height = detection['bottom'] - detection['top']
+                        _write_array_item(annotations_file, annotation_id, {
+                            'id': annotation_id,
+                            'image_id': image_id,
+                            'category_id': category_ids[label],
+                            'bbox': [detection['left'], detection['top'], width, height],
+                            'area': width * height,
+                            'segmentation': [],
+                            'iscrowd': 0,
+                        })
+
+                out_file.write('], "annotations": [')
+                annotations_file.seek(0)
+                shutil.copyfileobj(annotations_file, out_file)
+                out_file.write('], "categories": ')
+                json.dump([
+                    {'id': category_id, 'name': label, 'supercategory': label}
+                    for label, category_id in category_ids.items()
+                ], out_file)
+                out_file.write('}\n')
+
+            os.replace(tmp_out_path, out_path)
+        finally:
+            if os.path.exists(tmp_out_path):
+                os.remove(tmp_out_path)
+
+    def _write_image(self, src, dst):
+        if self.link_images:
+            if os.path.exists(dst):
+                os.remove(dst)
+            try:
+                os.link(src, dst)
+                return
+            except OSError:
+                pass
+        shutil.copyfile(src, dst)
+
+
+def _write_array_item(out_file, item_number, item):
+    if item_number > 1:
+        out_file.write(',')
+    out_file.write('\n')
+    json.dump(item, out_file)
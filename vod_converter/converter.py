@@ -10,8 +10,22 @@ can output the data to the filesystem.
 
 See `main.py` for the supported types, and `voc.py` and `kitti.py` for reference.
 """
+import functools
+import hashlib
+import itertools
+import os
+import shutil
+import sys
+import tempfile
+import time
+
 from jsonschema import validate as raw_validate
 from jsonschema.exceptions import ValidationError as SchemaError
+from PIL import Image
+
+import autotune
+import pipeline
+import transcode
 
 
 def validate_schema(data, schema):
@@ -39,6 +53,13 @@ IMAGE_SCHEMA = {
     'required': ['id', 'path', 'segmented_path', 'width', 'height']
 }
 
+# For conversions whose egestor doesn't need image dimensions, which may then never be read (see `LazyImage`)
+IMAGE_SCHEMA_WITHOUT_DIMENSIONS = {
+    'type': 'object',
+    'properties': {k: v for k, v in IMAGE_SCHEMA['properties'].items() if k not in ('width', 'height')},
+    'required': ['id', 'path', 'segmented_path']
+}
+
 
 DETECTION_SCHEMA = {
     'type': 'object',
@@ -47,7 +68,15 @@ DETECTION_SCHEMA = {
         'top': {'type': 'number', 'minimum': 0},
         'left': {'type': 'number', 'minimum': 0},
         'right': {'type': 'number', 'minimum': 0},
-        'bottom': {'type': 'number', 'minimum': 0}
+        'bottom': {'type': 'number', 'minimum': 0},
+        # optional extras of KITTI labels, see `kitti.py`
+        'truncated': {'type': 'number'},
+        'occluded': {'type': 'integer'},
+        'alpha': {'type': 'number'},
+        'dimensions': {'type': 'array', 'items': {'type': 'number'}},
+        'location': {'type': 'array', 'items': {'type': 'number'}},
+        'rotation_y': {'type': 'number'},
+        'score': {'type': 'number'}
     },
     'required': ['top', 'left', 'right', 'bottom']
 }
@@ -63,6 +92,185 @@ IMAGE_DETECTION_SCHEMA = {
     }
 }
 
+IMAGE_DETECTION_SCHEMA_WITHOUT_DIMENSIONS = {
+    'type': 'object',
+    'properties': dict(IMAGE_DETECTION_SCHEMA['properties'], image=IMAGE_SCHEMA_WITHOUT_DIMENSIONS)
+}
+
+
+class LazyImage(dict):
+    """
+    An image dict conforming to `IMAGE_SCHEMA` whose 'width' and 'height' are read from the image file the first
+    time either is accessed, so conversions that don't need them never open the image.
+
+    :param on_dimensions: optional function called with (width, height) once they are read, e.g to clamp
+        detections to the image
+    """
+
+    def __init__(self, *, on_dimensions=None, **fields):
+        super().__init__(**fields)
+        self._on_dimensions = on_dimensions
+
+    def __missing__(self, key):
+        if key not in ('width', 'height'):
+            raise KeyError(key)
+        self.load_dimensions()
+        return self[key]
+
+    def __contains__(self, key):
+        return key in ('width', 'height') or super().__contains__(key)
+
+    def get(self, key, default=None):
+        return self[key] if key in self else default
+
+    def needs_dimensions(self):
+        """
+        Whether an `on_dimensions` function, e.g clamping detections, is waiting for the dimensions to be read.
+        """
+        return self._on_dimensions is not None
+
+    def load_dimensions(self):
+        width, height = image_dimensions(self['path'])
+        self['width'] = width
+        self['height'] = height
+        on_dimensions, self._on_dimensions = self._on_dimensions, None
+        if on_dimensions is not None:
+            on_dimensions(width, height)
+
+
+def image_dimensions(path):
+    with Image.open(path) as image:
+        return image.width, image.height
+
+
+def clamp_to_image(detections):
+    """
+    :return: an `on_dimensions` function for `LazyImage` clamping the right and bottom of the detections to
+        the image
+    """
+    def clamp(image_width, image_height):
+        for det in detections:
+            if det['right'] > image_width - 1:
+                det['right'] = image_width - 1
+            if det['bottom'] > image_height - 1:
+                det['bottom'] = image_height - 1
+    return clamp
+
+
+class Sampler:
+    """
+    Selects a subset of images to ingest.
+
+    Sampling is by a hash of the image id, so the same ids are selected on every run, and converting the
+    same images from another format selects the same subset as long as their ids match.
+
+    :param fraction: keep roughly this fraction (0 to 1) of images, or all images if None
+    :param seed: different seeds select different (independent) subsets
+    :param limit: stop after this many images, or never if None
+    :param shard: optional (index, count) to keep only one of count disjoint shards, e.g to split ingestion
+        across workers
+    :param image_ids: optional collection of image ids to restrict the sample to
+    """
+
+    def __init__(self, *, fraction=None, seed=0, limit=None, shard=None, image_ids=None):
+        self.fraction = fraction
+        self.seed = seed
+        self.limit = limit
+        self.shard = shard
+        self.image_ids = image_ids
+
+    def includes(self, image_id):
+        if self.image_ids is not None and image_id not in self.image_ids:
+            return False
+        if not self.in_shard(image_id):
+            return False
+        if self.fraction is None:
+            return True
+        return _id_hash(self.seed, image_id) < self.fraction * 2 ** 64
+
+    def in_shard(self, key):
+        """
+        Whether key, an image id or e.g the name of a file of several images, falls in this sampler's shard.
+        """
+        if self.shard is None:
+            return True
+        index, count = self.shard
+        return _id_hash('shard', key) % count == index
+
+    def unsharded(self):
+        """
+        :return: a `Sampler` selecting this sample from all shards, for ingestors that shard by something other
+            than image ids, having checked `in_shard` for that themselves
+        """
+        return Sampler(fraction=self.fraction, seed=self.seed, limit=self.limit, image_ids=self.image_ids)
+
+    def sharded(self, index, count):
+        """
+        :return: a `Sampler` selecting shard index of count from this sample, without a limit since that
+            applies to the shards combined
+        """
+        return Sampler(fraction=self.fraction, seed=self.seed, shard=(index, count), image_ids=self.image_ids)
+
+    def select(self, candidates, *, key=lambda image_id: image_id):
+        """
+        Lazily filter candidates to those included in the sample, stopping once the limit is reached.
+
+        Ingestors should pass in candidates that will each end up as an image detection and do any per-image
+        work only for the selected ones.
+
+        :param candidates: an iterable of anything from which `key` gets an image id
+        :param key: function from candidate to image id
+        """
+        selected = (candidate for candidate in candidates if self.includes(key(candidate)))
+        return self.take(selected)
+
+    def take(self, candidates):
+        """
+        Lazily stop once the limit is reached, for ingestors that already checked `includes` themselves
+        because deciding whether a candidate ends up as an image detection is costly.
+        """
+        return itertools.islice(candidates, self.limit)
+
+
+def _id_hash(salt, image_id):
+    digest = hashlib.blake2b(f"{salt}:{image_id}".encode('utf-8'), digest_size=8).digest()
+    return int.from_bytes(digest, 'big')
+
+
+class LabelFilter:
+    """
+    The label selection a conversion will apply via `convert_labels`, handed to ingestors so they can skip
+    work for detections and images that would be dropped anyway.
+
+    The default filter keeps everything.
+    """
+
+    def __init__(self, *, expected_labels=None, select_only_known_labels=False, filter_images_without_labels=False):
+        self.convert_dict = label_conversions(expected_labels or {})
+        self.select_only_known_labels = select_only_known_labels
+        self.filter_images_without_labels = filter_images_without_labels
+
+    def convert(self, label):
+        """
+        :return: the label to use in the destination format, or None if the detection should be dropped
+        """
+        fallback_label = label if not self.select_only_known_labels else None
+        return self.convert_dict.get(label.lower(), fallback_label)
+
+    def filter_detections(self, detections):
+        """
+        Drop detections whose label would be dropped, leaving labels themselves as they are.
+        """
+        if not self.select_only_known_labels:
+            return detections
+        return [detection for detection in detections if self.convert(detection['label'])]
+
+    def keeps_image(self, detections):
+        """
+        :param detections: detections of an image, already passed through `filter_detections`
+        """
+        return bool(detections) or not self.filter_images_without_labels
+
 
 class Ingestor:
     def validate(self, path):
@@ -78,13 +286,62 @@ class Ingestor:
         """
         return True, None
 
-    def ingest(self, path):
+    def ingest(self, path, *, sampler=None, label_filter=None):
         """
         Read in data from the filesytem.
+
+        By default this collects everything yielded by `iter_ingest`; implement either method.
+
         :param path: '/path/to/data/'
+        :param sampler: optional `Sampler` restricting which images are read
+        :param label_filter: optional `LabelFilter` whose dropped detections and images may be left out
         :return: an array of dicts conforming to `IMAGE_DETECTION_SCHEMA`
         """
-        pass
+        return list(self.iter_ingest(path, sampler=sampler, label_filter=label_filter))
+
+    def iter_ingest(self, path, *, sampler=None, label_filter=None):
+        """
+        Lazily read in data from the filesystem, one image at a time.
+
+        Prefer implementing this over `ingest` so that consumers which only need a single pass
+        over the data (e.g statistics) can run in constant memory. Implementations should run image ids
+        through `sampler.select` before doing any per-image work such as parsing labels or probing images.
+
+        Applying `label_filter` is an optimization: detections and images it drops would be dropped by
+        `convert_labels` later on, so implementations should use it to skip probing images and building
+        records that won't be kept. Labels should be left as they are.
+
+        Where image dimensions aren't part of the annotations, use a `LazyImage` so that they're only read
+        from the image file if needed.
+
+        :param path: '/path/to/data/'
+        :param sampler: optional `Sampler` restricting which images are read
+        :param label_filter: optional `LabelFilter` whose dropped detections and images may be left out
+        :return: an iterable of dicts conforming to `IMAGE_DETECTION_SCHEMA`
+        """
+        sampler = sampler or Sampler()
+        yield from sampler.select(self.ingest(path), key=lambda image_detection: image_detection['image']['id'])
+
+    def shardable(self):
+        """
+        Whether `iter_ingest` with a sharded `Sampler` (see `Sampler.sharded`) only reads what's needed for that
+        shard, so that shards can be ingested concurrently without duplicating work. Otherwise consumers ingest
+        with a single thread.
+
+        :return: bool
+        """
+        return False
+
+    def watch_index(self, path):
+        """
+        Cheaply index the annotations of the data, to find images whose annotations were added or changed since
+        a previous call (see `watch.py`).
+
+        :param path: '/path/to/data/'
+        :return: a dict from image id to a stamp that changes whenever the annotations of the image change,
+            starting with their modification time in ns, as returned by `file_stamps`
+        """
+        raise NotImplementedError()
 
 
 class Egestor:
@@ -101,6 +358,34 @@ class Egestor:
         """
         raise NotImplementedError()
 
+    def index_file(self):
+        """
+        Where the list of image ids is written, if this format has one. Allows converting new images into an
+        existing output, e.g in `watch.py`, where each file other than the index is written per image.
+
+        :return: the index file's path relative to the output root, e.g 'train.txt', or None
+        """
+        return None
+
+    def required_image_fields(self):
+        """
+        Which fields of `IMAGE_SCHEMA` `egest` reads. If 'width' and 'height' aren't needed, conversions skip
+        checking that bounding boxes are within the image, so ingestors producing `LazyImage`s only read image
+        files where detections have to be clamped to the image.
+
+        :return: a set of field names
+        """
+        return set(IMAGE_SCHEMA['required'])
+
+    def image_format(self):
+        """
+        Which format images must be in, if any. Images in other formats are transcoded before egesting (see
+        `transcode.py`).
+
+        :return: 'jpeg', 'png' or None
+        """
+        return None
+
     def egest(self, *, image_detections, root):
         """
         Output data to the filesystem.
@@ -114,7 +399,8 @@ class Egestor:
         raise NotImplementedError()
 
 
-def convert(*, from_path, ingestor, to_path, egestor, select_only_known_labels, filter_images_without_labels):
+def convert(*, from_path, ingestor, to_path, egestor, select_only_known_labels, filter_images_without_labels,
+            sampler=None, max_inflight_images=256, memory_budget=None, transcoder=None):
     """
     Converts between data formats, validating that the converted data matches
     `IMAGE_DETECTION_SCHEMA` along the way.
@@ -123,63 +409,296 @@ def convert(*, from_path, ingestor, to_path, egestor, select_only_known_labels,
     :param ingestor: `Ingestor` to read in data
     :param to_path: '/path/to/write/to'
     :param egestor: `Egestor` to write out data
+    :param sampler: optional `Sampler` to convert only a subset of images
+    :param max_inflight_images: how many images ingestion may get ahead of egestion, or None for no limit
+    :param memory_budget: bytes that images ingested ahead of egestion may take up, or None for no limit
+    :param transcoder: optional `transcode.Transcoder` to re-encode or downscale images with
     :return: (success, message)
     """
-    from_valid, from_msg = ingestor.validate(from_path)
+    return convert_many(sources=[(from_path, ingestor)], to_path=to_path, egestor=egestor,
+                        select_only_known_labels=select_only_known_labels,
+                        filter_images_without_labels=filter_images_without_labels,
+                        sampler=sampler, max_inflight_images=max_inflight_images, memory_budget=memory_budget,
+                        transcoder=transcoder)
+
+
+def convert_many(*, sources, to_path, egestor, select_only_known_labels, filter_images_without_labels,
+                 sampler=None, namespace_ids=False, max_inflight_images=256, memory_budget=None, ingest_workers=1,
+                 transcoder=None, tuner=None):
+    """
+    Converts several datasets into one, like `convert`. Sources take turns, one image at a time, so the order
+    images are written in, and which ones a limit selects, depends only on the sources.
 
-    if not from_valid:
-        return from_valid, from_msg
+    Stages run concurrently: sources are ingested and validated in background threads while the images ingested
+    so far are label converted and egested, with ingestion blocking once it's max_inflight_images images or
+    memory_budget bytes ahead. Output is written to a staging directory within to_path and only moved into
+    place once the conversion succeeded, so nothing is written if it fails, e.g because image ids collide. Image
+    ids new to the index of an existing output, see `Egestor.index_file`, are appended to it.
 
-    image_detections = ingestor.ingest(from_path)
-    validate_image_detections(image_detections)
-    image_detections = convert_labels(
-        image_detections=image_detections, expected_labels=egestor.expected_labels(),
-        select_only_known_labels=select_only_known_labels,
-        filter_images_without_labels=filter_images_without_labels)
+    Image ids must be unique across sources, or namespaced with `namespace_ids`.
 
-    egestor.egest(image_detections=image_detections, root=to_path)
+    :param sources: list of ('/path/to/read/from', `Ingestor`)
+    :param to_path: '/path/to/write/to'
+    :param egestor: `Egestor` to write out data
+    :param sampler: optional `Sampler` to convert only a subset of images; a limit applies to all sources combined
+    :param namespace_ids: prefix image ids with the index of their source, e.g '1-000042'
+    :param max_inflight_images: how many images ingestion may get ahead of egestion, or None for no limit
+    :param memory_budget: bytes that images ingested ahead of egestion may take up, or None for no limit
+    :param ingest_workers: how many threads to ingest each source with, each reading a disjoint shard of it.
+        Images of the shards take turns, so the order depends on the number of workers. Ignored with a limit,
+        so that the same images are selected regardless, and for sources whose ingestor isn't
+        `Ingestor.shardable`.
+    :param transcoder: optional `transcode.Transcoder` to re-encode or downscale images with. Images are always
+        re-encoded to the egestor's `Egestor.image_format`, if it has one, whatever the transcoder's format.
+    :param tuner: optional `autotune.Tuner` to measure the conversion with and, if auto, to tune how many ingest
+        workers and transcoder processes are active
+    :return: (success, message)
+    """
+    for from_path, ingestor in sources:
+        from_valid, from_msg = ingestor.validate(from_path)
+        if not from_valid:
+            return from_valid, from_msg if len(sources) == 1 else f"{from_path}: {from_msg}"
+
+    sampler = sampler or Sampler()
+    if sampler.limit is not None:
+        ingest_workers = 1
+    expected_labels = egestor.expected_labels()
+    label_filter = LabelFilter(expected_labels=expected_labels,
+                               select_only_known_labels=select_only_known_labels,
+                               filter_images_without_labels=filter_images_without_labels)
+    check_bounds = {'width', 'height'} <= egestor.required_image_fields()
+    if egestor.image_format() is not None:
+        transcoder = (transcoder or transcode.Transcoder()).with_format(egestor.image_format())
+    tuner = tuner or autotune.Tuner()
+
+    def ingest_shard(source_idx, shard_sampler):
+        from_path, ingestor = sources[source_idx]
+        image_detections = iter(ingestor.iter_ingest(from_path, sampler=shard_sampler, label_filter=label_filter))
+        while True:
+            with ingest_throttle:
+                started_at = time.monotonic()
+                image_detection = next(image_detections, None)
+                if image_detection is None:
+                    return
+                validate_image_detections([image_detection], check_bounds=check_bounds)
+                tuner.observe('ingest', time.monotonic() - started_at)
+            yield source_idx, image_detection
+
+    def shard_samplers(ingestor):
+        shards = ingest_workers if ingestor.shardable() else 1
+        return [sampler] if shards == 1 else [sampler.sharded(shard, shards) for shard in range(shards)]
+
+    producer_groups = [
+        [functools.partial(ingest_shard, source_idx, shard_sampler) for shard_sampler in shard_samplers(ingestor)]
+        for source_idx, (_, ingestor) in enumerate(sources)
+    ]
+    # all shards share one throttle, while `ingest_workers` counts the shards of each shardable source
+    sharded_sources = sum(len(producers) > 1 for producers in producer_groups)
+    unsharded_sources = len(producer_groups) - sharded_sources
+    ingest_throttle = tuner.stage(
+        'ingest', workers=sum(len(producers) for producers in producer_groups),
+        option=lambda limit: max(1, -(-(limit - unsharded_sources) // sharded_sources)) if sharded_sources else 1)
+    tuner.start()
+    ingested = pipeline.iter_concurrently(producer_groups, max_items=max_inflight_images, max_bytes=memory_budget,
+                                          item_size=lambda item: estimate_size([item[1]]))
+
+    def converted_image_detections():
+        image_ids = {}
+        for source_idx, image_detection in itertools.islice(ingested, sampler.limit):
+            image = image_detection['image']
+            if namespace_ids:
+                image['id'] = f"{source_idx}-{image['id']}"
+            if image['id'] in image_ids:
+                other_path = sources[image_ids[image['id']]][0]
+                raise _IdCollision(f"Image id {image['id']} of {sources[source_idx][0]} is also used by {other_path}")
+            image_ids[image['id']] = source_idx
+            image_detection = convert_image_labels(image_detection, label_filter=label_filter)
+            if image_detection is not None:
+                yield image_detection
+
+    def egested_image_detections(image_detections):
+        for image_detection in image_detections:
+            started_at = time.monotonic()
+            yield image_detection
+            tuner.observe('egest', time.monotonic() - started_at)
+            tuner.image_done()
+
+    os.makedirs(to_path, exist_ok=True)
+    staging_path = tempfile.mkdtemp(prefix='.convert-', dir=to_path)
+    transcoded_path = None
+    transcoded = converted_image_detections()
+    if transcoder is not None:
+        transcoded_path = tempfile.mkdtemp(prefix='.transcode-', dir=to_path)
+        transcoded = transcoder.transcode(transcoded, out_dir=transcoded_path, tuner=tuner)
+    image_detections = egested_image_detections(transcoded)
+    try:
+        egestor.egest(image_detections=image_detections, root=staging_path)
+        _move_into_place(staging_path, to_path, index_file=egestor.index_file())
+    except _IdCollision as e:
+        return False, str(e)
+    finally:
+        image_detections.close()
+        transcoded.close()
+        ingested.close()
+        shutil.rmtree(staging_path, ignore_errors=True)
+        if transcoded_path is not None:
+            shutil.rmtree(transcoded_path, ignore_errors=True)
     return True, ''
 
 
-def validate_image_detections(image_detections):
+def _move_into_place(staging_path, to_path, *, index_file):
+    """
+    Move converted files into to_path, appending image ids to its index rather than replacing it, so converting
+    into a non empty to_path adds to what's there.
+    """
+    if index_file is None:
+        move_files(staging_path, to_path)
+        return
+    staged_index_path = os.path.join(staging_path, index_file)
+    move_files(staging_path, to_path, exclude={staged_index_path})
+    index_path = os.path.join(to_path, index_file)
+    os.makedirs(os.path.dirname(index_path), exist_ok=True)
+    indexed_ids = set(read_index(index_path))
+    append_index(index_path, [image_id for image_id in read_index(staged_index_path) if image_id not in indexed_ids])
+
+
+def read_index(index_path):
+    """
+    :return: list of image ids in an index file as named by `Egestor.index_file`, empty if there's none
+    """
+    if not os.path.isfile(index_path):
+        return []
+    with open(index_path) as f:
+        return [line.strip() for line in f if line.strip()]
+
+
+def append_index(index_path, image_ids):
+    """
+    Append image ids to an index file in a single write, creating it if need be.
+    """
+    if not image_ids:
+        return
+    fd = os.open(index_path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+    try:
+        os.write(fd, ''.join(f"{image_id}\n" for image_id in image_ids).encode('utf-8'))
+    finally:
+        os.close(fd)
+
+
+def move_files(from_dir, to_dir, *, exclude=()):
+    """
+    Move every file within from_dir to the same relative path within to_dir, replacing files already there.
+
+    :param exclude: paths of files within from_dir to leave where they are
+    """
+    for dir_path, _, file_names in os.walk(from_dir):
+        for file_name in file_names:
+            from_path = os.path.join(dir_path, file_name)
+            if from_path in exclude:
+                continue
+            to_path = os.path.join(to_dir, os.path.relpath(from_path, from_dir))
+            os.makedirs(os.path.dirname(to_path), exist_ok=True)
+            os.replace(from_path, to_path)
+
+
+class _IdCollision(Exception):
+    pass
+
+
+def estimate_size(image_detections):
+    """
+    Roughly estimate how many bytes image detections take up in memory.
+    """
+    size = sys.getsizeof(image_detections)
+    for image_detection in image_detections:
+        size += _shallow_size(image_detection) + _shallow_size(image_detection['image'])
+        size += sys.getsizeof(image_detection['detections'])
+        for detection in image_detection['detections']:
+            size += _shallow_size(detection)
+    return size
+
+
+def _shallow_size(mapping):
+    return sys.getsizeof(mapping) + sum(sys.getsizeof(value) for value in mapping.values())
+
+
+def validate_image_detections(image_detections, *, check_bounds=True):
+    """
+    :param check_bounds: whether to require image dimensions and check bounding boxes lie within them. Without,
+        dimensions of `LazyImage`s are still read if detections depend on them, e.g to be clamped to the image.
+    """
+    schema = IMAGE_DETECTION_SCHEMA if check_bounds else IMAGE_DETECTION_SCHEMA_WITHOUT_DIMENSIONS
     for i, image_detection in enumerate(image_detections):
+        image = image_detection['image']
+        if not check_bounds and hasattr(image, 'needs_dimensions') and image.needs_dimensions():
+            image.load_dimensions()
         try:
-            validate_schema(image_detection, IMAGE_DETECTION_SCHEMA)
+            validate_schema(image_detection, schema)
         except SchemaError as se:
             raise Exception(f"at index {i}") from se
-        image = image_detection['image']
         for detection in image_detection['detections']:
-            if detection['right'] >= image['width'] or detection['bottom'] >= image['height']:
+            if check_bounds and (detection['right'] >= image['width'] or detection['bottom'] >= image['height']):
                 raise ValueError(f"Image {image} has out of bounds bounding box {detection}")
             if detection['right'] <= detection['left'] or detection['bottom'] <= detection['top']:
                 raise ValueError(f"Image {image} has zero dimension bbox {detection}")
 
 
-def convert_labels(*, image_detections, expected_labels,
-                   select_only_known_labels, filter_images_without_labels):
+def file_stamps(directory, *, suffix):
+    """
+    Stamp files in a directory for change detection, with a single directory scan.
+
+    :param directory: '/path/to/dir'
+    :param suffix: only include files with this suffix, e.g '.txt'
+    :return: a dict from file name without suffix to (modification time in ns, size)
+    """
+    stamps = {}
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            if entry.name.endswith(suffix) and entry.is_file():
+                stat = entry.stat()
+                stamps[entry.name[:-len(suffix)]] = (stat.st_mtime_ns, stat.st_size)
+    return stamps
+
+
+def label_conversions(expected_labels):
+    """
+    Flatten `Egestor.expected_labels` into a lookup from lowercased label or alias to the expected label.
+    """
     convert_dict = {}
     for label, aliases in expected_labels.items():
         convert_dict[label.lower()] = label
         for alias in aliases:
             convert_dict[alias.lower()] = label
+    return convert_dict
+
+
+def convert_labels(*, image_detections, expected_labels,
+                   select_only_known_labels, filter_images_without_labels):
+    label_filter = LabelFilter(expected_labels=expected_labels,
+                               select_only_known_labels=select_only_known_labels,
+                               filter_images_without_labels=filter_images_without_labels)
 
     final_image_detections = []
     for image_detection in image_detections:
-        detections = []
-        for detection in image_detection['detections']:
-            label = detection['label']
-            fallback_label = label if not select_only_known_labels else None
-            final_label = convert_dict.get(label.lower(), fallback_label)
-            if final_label:
-                detection['label'] = final_label
-                detections.append(detection)
-        image_detection['detections'] = detections
-        if detections:
-            final_image_detections.append(image_detection)
-        elif not filter_images_without_labels:
+        image_detection = convert_image_labels(image_detection, label_filter=label_filter)
+        if image_detection is not None:
             final_image_detections.append(image_detection)
 
     return final_image_detections
 
 
+def convert_image_labels(image_detection, *, label_filter):
+    """
+    Convert the labels of a single image detection in place, like `convert_labels` but with a `LabelFilter` built
+    once by the caller.
 
+    :return: the image detection, or None if it's filtered out
+    """
+    detections = []
+    for detection in image_detection['detections']:
+        final_label = label_filter.convert(detection['label'])
+        if final_label:
+            detection['label'] = final_label
+            detections.append(detection)
+    image_detection['detections'] = detections
+    return image_detection if label_filter.keeps_image(detections) else None
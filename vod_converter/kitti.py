@@ -30,15 +30,24 @@ each row corresponds to one object. The 15 columns represent:
 
 """
 
+from concurrent.futures import ThreadPoolExecutor
 import csv
+import itertools
 import os
-from PIL import Image
 import shutil
 
-from converter import Ingestor, Egestor
+from converter import Ingestor, Egestor, LabelFilter, LazyImage, Sampler, file_stamps
 
 
 class KITTIIngestor(Ingestor):
+    def __init__(self, *, label_batch_size=256, label_read_workers=8):
+        """
+        :param label_batch_size: how many label files to read and parse at once
+        :param label_read_workers: threads reading label files of a batch concurrently
+        """
+        self.label_batch_size = label_batch_size
+        self.label_read_workers = label_read_workers
+
     def validate(self, path):
         expected_dirs = [
             'training/image_2',
@@ -51,13 +60,41 @@ class KITTIIngestor(Ingestor):
             return False, f"Expected train.txt file within {path}"
         return True, None
 
-    def ingest(self, path):
+    def iter_ingest(self, path, *, sampler=None, label_filter=None):
+        sampler = sampler or Sampler()
+        label_filter = label_filter or LabelFilter()
         image_ids = self._get_image_ids(path)
         image_ext = 'png'
         if len(image_ids):
             first_image_id = image_ids[0]
             image_ext = self.find_image_ext(path, first_image_id)
-        return [self._get_image_detection(path, image_name, image_ext=image_ext) for image_name in image_ids]
+
+        batch_size = self.label_batch_size
+        if sampler.limit is not None:
+            batch_size = max(1, min(batch_size, sampler.limit))
+
+        def candidates():
+            sampled_ids = (image_id for image_id in image_ids if sampler.includes(image_id))
+            with ThreadPoolExecutor(self.label_read_workers) as executor:
+                for batch in _batches(sampled_ids, batch_size):
+                    labels_paths = [f"{path}/training/label_2/{image_id}.txt" for image_id in batch]
+                    batch_detections = read_label_files(labels_paths, executor=executor)
+                    for image_id, detections in zip(batch, batch_detections):
+                        detections = [det for det in detections
+                                      if det['left'] < det['right'] and det['top'] < det['bottom']]
+                        detections = label_filter.filter_detections(detections)
+                        if label_filter.keeps_image(detections):
+                            yield image_id, detections
+
+        for image_id, detections in sampler.take(candidates()):
+            yield self._get_image_detection(path, image_id, detections, image_ext=image_ext)
+
+    def shardable(self):
+        return True
+
+    def watch_index(self, path):
+        label_stamps = file_stamps(f"{path}/training/label_2", suffix='.txt')
+        return {image_id: label_stamps[image_id] for image_id in self._get_image_ids(path) if image_id in label_stamps}
 
     def find_image_ext(self, root, image_id):
         for image_ext in ['png', 'jpg']:
@@ -70,43 +107,89 @@ class KITTIIngestor(Ingestor):
         with open(path) as f:
             return f.read().strip().split('\n')
 
-    def _get_image_detection(self, root, image_id, *, image_ext='png'):
-        detections_fpath = f"{root}/training/label_2/{image_id}.txt"
-        detections = self._get_detections(detections_fpath)
-        detections = [det for det in detections if det['left'] < det['right'] and det['top'] < det['bottom']]
+    def _get_image_detection(self, root, image_id, detections, *, image_ext='png'):
         image_path = f"{root}/training/image_2/{image_id}.{image_ext}"
-        image_width, image_height = _image_dimensions(image_path)
         return {
-            'image': {
-                'id': image_id,
-                'path': image_path,
-                'segmented_path': None,
-                'width': image_width,
-                'height': image_height
-            },
+            'image': LazyImage(
+                id=image_id,
+                path=image_path,
+                segmented_path=None
+            ),
             'detections': detections
         }
 
-    def _get_detections(self, detections_fpath):
-        detections = []
-        with open(detections_fpath) as f:
-            f_csv = csv.reader(f, delimiter=' ')
-            for row in f_csv:
-                x1, y1, x2, y2 = map(float, row[4:8])
-                label = row[0]
-                detections.append({
-                    'label': label,
-                    'left': x1,
-                    'right': x2,
-                    'top': y1,
-                    'bottom': y2
-                })
-        return detections
-
-
-def _image_dimensions(path):
-    with Image.open(path) as image:
-        return image.width, image.height
+
+def read_label_files(paths, *, executor=None):
+    """
+    Read and parse a batch of KITTI label files.
+
+    Files are read concurrently if given an executor, and the numeric columns of all rows in the batch are
+    converted in one go before being split back up per file. Besides the label and bounding box, detections
+    keep the remaining KITTI columns where present: 'truncated', 'occluded', 'alpha', 'dimensions' (height,
+    width, length), 'location' (x, y, z), 'rotation_y' and, for results, 'score'.
+
+    :param paths: label file paths
+    :param executor: optional `concurrent.futures.Executor` to read files with
+    :return: a list of detections for each path
+    """
+    texts = executor.map(_read_text, paths) if executor else map(_read_text, paths)
+    rows_per_file = [[line.split() for line in text.splitlines() if line.strip()] for text in texts]
+    rows = list(itertools.chain.from_iterable(rows_per_file))
+
+    bboxes = list(map(float, itertools.chain.from_iterable(row[4:8] for row in rows)))
+    if len(bboxes) != 4 * len(rows):
+        raise ValueError(f"Expected a bounding box in every row of {', '.join(paths)}")
+    full_rows = [row for row in rows if len(row) >= 15]
+    extras = list(map(float, itertools.chain.from_iterable(row[1:4] + row[8:15] for row in full_rows)))
+
+    detections = []
+    full_row_idx = 0
+    for idx, row in enumerate(rows):
+        x1, y1, x2, y2 = bboxes[4 * idx:4 * idx + 4]
+        detection = {
+            'label': row[0],
+            'left': x1,
+            'right': x2,
+            'top': y1,
+            'bottom': y2
+        }
+        if len(row) >= 15:
+            truncated, occluded, alpha, height, width, length, x, y, z, rotation_y = \
+                extras[10 * full_row_idx:10 * full_row_idx + 10]
+            full_row_idx += 1
+            detection.update({
+                'truncated': truncated,
+                'occluded': int(occluded),
+                'alpha': alpha,
+                'dimensions': [height, width, length],
+                'location': [x, y, z],
+                'rotation_y': rotation_y
+            })
+            if len(row) > 15:
+                detection['score'] = float(row[15])
+        detections.append(detection)
+
+    detections_per_file = []
+    offset = 0
+    for file_rows in rows_per_file:
+        detections_per_file.append(detections[offset:offset + len(file_rows)])
+        offset += len(file_rows)
+    return detections_per_file
+
+
+def _read_text(path):
+    with open(path) as f:
+        return f.read()
+
+
+def _batches(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        batch = list(itertools.islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
 
 DEFAULT_TRUNCATED = 0.0 # 0% truncated
 DEFAULT_OCCLUDED = 0    # fully visible
@@ -125,6 +208,12 @@ class KITTIEgestor(Egestor):
             'Van': [],
         }
 
+    def index_file(self):
+        return 'train.txt'
+
+    def required_image_fields(self):
+        return {'id', 'path'}
+
     def egest(self, *, image_detections, root):
         images_dir = f"{root}/training/image_2"
         os.makedirs(images_dir, exist_ok=True)
@@ -149,13 +238,21 @@ class KITTIEgestor(Egestor):
                 for detection in image_detection['detections']:
                     kitti_row = [-1] * 15
                     kitti_row[0] = detection['label']
-                    kitti_row[1] = DEFAULT_TRUNCATED
-                    kitti_row[2] = DEFAULT_OCCLUDED
+                    kitti_row[1] = detection.get('truncated', DEFAULT_TRUNCATED)
+                    kitti_row[2] = detection.get('occluded', DEFAULT_OCCLUDED)
+                    if 'alpha' in detection:
+                        kitti_row[3] = detection['alpha']
                     x1 = detection['left']
                     x2 = detection['right']
                     y1 = detection['top']
                     y2 = detection['bottom']
                     kitti_row[4:8] = x1, y1, x2, y2
+                    if 'dimensions' in detection:
+                        kitti_row[8:11] = detection['dimensions']
+                    if 'location' in detection:
+                        kitti_row[11:14] = detection['location']
+                    if 'rotation_y' in detection:
+                        kitti_row[14] = detection['rotation_y']
                     csvwriter.writerow(kitti_row)
 
 
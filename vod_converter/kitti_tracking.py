@@ -52,9 +52,8 @@ import csv
 from collections import defaultdict
 import os
 import re
-from PIL import Image
 
-from converter import Ingestor
+from converter import Ingestor, LabelFilter, LazyImage, Sampler, clamp_to_image
 
 LABEL_F_PATTERN = re.compile('[0-9]+\.txt')
 
@@ -70,19 +69,33 @@ class KITTITrackingIngestor(Ingestor):
                 return False, f"Expected subdirectory {subdir} within {path}"
         return True, None
 
-    def ingest(self, path):
-        fs = os.listdir(f"{path}/label_02")
-        label_fnames = [f for f in fs if LABEL_F_PATTERN.match(f)]
-        image_detections = []
+    def iter_ingest(self, path, *, sampler=None, label_filter=None):
+        sampler = sampler or Sampler()
+        label_filter = label_filter or LabelFilter()
+        fs = sorted(os.listdir(f"{path}/label_02"))
+        # sharded by sequence, as each sequence's labels are in a single file
+        label_fnames = [f for f in fs if LABEL_F_PATTERN.match(f) and sampler.in_shard(f.split(".")[0])]
+        frames = self._iter_track_frames(path, label_fnames, label_filter=label_filter)
+        frames = sampler.unsharded().select(frames, key=lambda frame: _image_id(*frame[:2]))
+        for frame_name, frame_id, frame_dets in frames:
+            images_dir = f"{path}/image_02/{frame_name}"
+            yield self._get_frame_image_detection(
+                frame_name=frame_name, frame_id=frame_id, frame_dets=frame_dets, images_dir=images_dir)
+
+    def shardable(self):
+        return True
+
+    def _iter_track_frames(self, path, label_fnames, *, label_filter):
         for label_fname in label_fnames:
             frame_name = label_fname.split(".")[0]
             labels_path = f"{path}/label_02/{label_fname}"
-            images_dir = f"{path}/image_02/{frame_name}"
-            image_detections.extend(
-                self._get_track_image_detections(frame_name=frame_name, labels_path=labels_path, images_dir=images_dir))
-        return image_detections
+            detections_by_frame = self._get_track_detections(labels_path)
+            for frame_id in sorted(detections_by_frame.keys()):
+                frame_dets = label_filter.filter_detections(detections_by_frame[frame_id])
+                if label_filter.keeps_image(frame_dets):
+                    yield frame_name, frame_id, frame_dets
 
-    def _get_track_image_detections(self, *, frame_name, labels_path, images_dir):
+    def _get_track_detections(self, labels_path):
         detections_by_frame = defaultdict(list)
         with open(labels_path) as f:
             f_csv = csv.reader(f, delimiter=' ')
@@ -97,32 +110,22 @@ class KITTITrackingIngestor(Ingestor):
                     'top': y1,
                     'bottom': y2
                 })
-
-        image_detections = []
-        for frame_id in sorted(detections_by_frame.keys()):
-            frame_dets = detections_by_frame[frame_id]
-            image_path = f"{images_dir}/{frame_id:06d}.png"
-            if not os.path.exists(image_path):
-                image_path = f"{images_dir}/{frame_id:06d}.jpg"
-            with Image.open(image_path) as image:
-                image_width = image.width
-                image_height = image.height
-
-                def clamp_bbox(det):
-                    if det['right'] > image_width - 1:
-                        det['right'] = image_width - 1
-                    if det['bottom'] > image_height - 1:
-                        det['bottom'] = image_height - 1
-                    return det
-
-                image_detections.append({
-                    'image': {
-                        'id': f"{frame_name}-{frame_id:06d}",
-                        'path': image_path,
-                        'segmented_path': None,
-                        'width': image.width,
-                        'height': image.height
-                    },
-                    'detections': [clamp_bbox(det) for det in frame_dets]
-                })
-        return image_detections
+        return detections_by_frame
+
+    def _get_frame_image_detection(self, *, frame_name, frame_id, frame_dets, images_dir):
+        image_path = f"{images_dir}/{frame_id:06d}.png"
+        if not os.path.exists(image_path):
+            image_path = f"{images_dir}/{frame_id:06d}.jpg"
+        return {
+            'image': LazyImage(
+                id=_image_id(frame_name, frame_id),
+                path=image_path,
+                segmented_path=None,
+                on_dimensions=clamp_to_image(frame_dets)
+            ),
+            'detections': frame_dets
+        }
+
+
+def _image_id(frame_name, frame_id):
+    return f"{frame_name}-{frame_id:06d}"
@@ -3,16 +3,28 @@ Converts between visual object detection dataset formats. See `converter.py` for
 
 To add support for additional data formats, define a module with an `converter.Ingestor` and/or
 `converter.Egestor` implementation and add them to the `INGESTORS` and `EGESTORS` dicts below.
+
+Besides converting (the default command), `stats` summarizes the `--from` dataset as JSON on stdout, mapping
+labels onto those expected by the `--to` format, without writing anything. See `stats.py`. `watch` keeps running,
+converting images as their annotations are added or changed. See `watch.py`. `serve` runs a local server
+converting datasets it keeps in memory. See `server.py`.
 """
 
 import argparse
+import json
 import logging
 
+import autotune
+import coco
 import converter
 import kitti
 import kitti_tracking
+import server
+import stats
+import transcode
 import udacity
 import voc
+import watch
 
 import sys
 
@@ -29,41 +41,136 @@ INGESTORS = {
 
 EGESTORS = {
     'voc': voc.VOCEgestor(),
-    'kitti': kitti.KITTIEgestor()
+    'kitti': kitti.KITTIEgestor(),
+    'coco': coco.COCOEgestor()
 }
 
+# formats whose ingestors implement `converter.Ingestor.watch_index`
+WATCH_FORMATS = ['kitti', 'voc']
+
+SERVE_MEMORY_BUDGET = 2 * 1024 ** 3
+SERVE_WORKERS = 4
+
+# the most ingest threads per source '--workers auto' may use
+AUTO_INGEST_WORKERS = 16
+
 
-def main(*, from_path, from_key, to_path, to_key, select_only_known_labels, filter_images_without_labels):
-    success, msg = converter.convert(from_path=from_path, ingestor=INGESTORS[from_key],
-                                     to_path=to_path, egestor=EGESTORS[to_key],
-                                     select_only_known_labels=select_only_known_labels,
-                                     filter_images_without_labels=filter_images_without_labels)
+def main(*, from_paths, from_keys, to_path, to_key, select_only_known_labels, filter_images_without_labels,
+         command='convert', sampler=None, namespace_ids=False, poll_interval=1.0, socket_path=None, port=None,
+         workers=None, memory_budget=None, max_inflight_images=256, image_format=None, image_quality=90,
+         max_image_size=None, report_path=None, link_images=False):
+    if command == 'serve':
+        return main_serve(socket_path=socket_path, port=port, workers=workers or SERVE_WORKERS,
+                          memory_budget=memory_budget or SERVE_MEMORY_BUDGET)
+    if command == 'stats':
+        return main_stats(from_path=from_paths[0], from_key=from_keys[0], to_key=to_key,
+                          select_only_known_labels=select_only_known_labels, sampler=sampler)
+    if command == 'watch':
+        return main_watch(from_path=from_paths[0], from_key=from_keys[0], to_path=to_path, to_key=to_key,
+                          select_only_known_labels=select_only_known_labels,
+                          filter_images_without_labels=filter_images_without_labels,
+                          poll_interval=poll_interval)
+
+    ingest_workers, transcode_workers, tuner = _convert_workers(workers)
+    transcoder = None
+    if image_format or max_image_size or transcode_workers:
+        transcoder = transcode.Transcoder(image_format=image_format, quality=image_quality, max_size=max_image_size,
+                                          workers=transcode_workers)
+    egestor = coco.COCOEgestor(link_images=True) if link_images and to_key == 'coco' else EGESTORS[to_key]
+    sources = [(from_path, INGESTORS[from_key]) for from_path, from_key in zip(from_paths, from_keys)]
+    success, msg = converter.convert_many(sources=sources,
+                                          to_path=to_path, egestor=egestor,
+                                          select_only_known_labels=select_only_known_labels,
+                                          filter_images_without_labels=filter_images_without_labels,
+                                          sampler=sampler, namespace_ids=namespace_ids,
+                                          max_inflight_images=max_inflight_images, memory_budget=memory_budget,
+                                          ingest_workers=ingest_workers, transcoder=transcoder, tuner=tuner)
+    from_key = ', '.join(from_keys)
     if success:
+        if report_path is not None:
+            with open(report_path, 'w') as report_file:
+                json.dump(tuner.report(), report_file, indent=2)
         print(f"Successfully converted from {from_key} to {to_key}.")
     else:
         print(f"Failed to convert from {from_key} to {to_key}: {msg}")
         return 1
 
 
+def _convert_workers(workers):
+    """
+    :param workers: as parsed by `autotune.parse_workers`, or None
+    :return: (ingest threads per source, transcode processes or None for one per core, `autotune.Tuner`)
+    """
+    if workers == 'auto':
+        return AUTO_INGEST_WORKERS, None, autotune.Tuner(auto=True)
+    if isinstance(workers, int):
+        return workers, workers, autotune.Tuner()
+    workers = workers or {}
+    return workers.get('ingest', 1), workers.get('transcode'), autotune.Tuner()
+
+
+def main_stats(*, from_path, from_key, to_key, select_only_known_labels, sampler=None):
+    ingestor = INGESTORS[from_key]
+    from_valid, from_msg = ingestor.validate(from_path)
+    if not from_valid:
+        print(f"Failed to read {from_key}: {from_msg}", file=sys.stderr)
+        return 1
+    dataset_stats = stats.compute_stats(
+        image_detections=ingestor.iter_ingest(from_path, sampler=sampler),
+        expected_labels=EGESTORS[to_key].expected_labels(),
+        select_only_known_labels=select_only_known_labels)
+    print(json.dumps(dataset_stats, indent=2))
+
+
+def main_watch(*, from_path, from_key, to_path, to_key, select_only_known_labels, filter_images_without_labels,
+               poll_interval):
+    print(f"Watching {from_path} for new {from_key} annotations to convert to {to_key}.")
+    success, msg = watch.watch(from_path=from_path, ingestor=INGESTORS[from_key],
+                               to_path=to_path, egestor=EGESTORS[to_key],
+                               select_only_known_labels=select_only_known_labels,
+                               filter_images_without_labels=filter_images_without_labels,
+                               poll_interval=poll_interval)
+    if not success:
+        print(f"Failed to watch {from_key} for conversion to {to_key}: {msg}")
+        return 1
+
+
+def main_serve(*, socket_path, port, workers, memory_budget):
+    conversion_server = server.make_server(ingestors=INGESTORS, egestors=EGESTORS, socket_path=socket_path,
+                                           port=port, workers=workers, memory_budget=memory_budget)
+    print(f"Serving conversions on {socket_path or conversion_server.server_address}.")
+    try:
+        conversion_server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        conversion_server.server_close()
+
+
 def parse_args():
     parser = argparse.ArgumentParser(description='Convert visual object datasets.')
     parser._action_groups.pop()
+    parser.add_argument('command', nargs='?', default='convert', choices=['convert', 'stats', 'watch', 'serve'],
+                        help="'convert' (default), 'stats' to summarize the --from dataset as JSON, "
+                             "with labels mapped as for the --to format, 'watch' to keep converting images "
+                             "as their annotations are added or changed, or 'serve' to run a conversion server")
     required = parser.add_argument_group('required arguments')
     optional = parser.add_argument_group('optional arguments')
     required.add_argument('--from',
-                          dest='from_key',
-                          required=True,
-                          help=f'Format to convert from: one of {", ".join(INGESTORS.keys())}', type=str)
-    required.add_argument('--from-path', dest='from_path',
-                          required=True,
+                          dest='from_keys',
+                          required=False, action='append',
+                          help=f'Format to convert from: one of {", ".join(INGESTORS.keys())}. '
+                               f'Repeat along with --from-path to merge several datasets.', type=str)
+    required.add_argument('--from-path', dest='from_paths',
+                          required=False, action='append',
                           help=f'Path to dataset you wish to convert.', type=str)
-    required.add_argument('--to', dest='to_key', required=True,
+    required.add_argument('--to', dest='to_key', required=False,
                           help=f'Format to convert to: one of {", ".join(EGESTORS.keys())}',
                           type=str)
     required.add_argument(
         '--to-path',
-        dest='to_path', required=True,
-        help="Path to output directory for converted dataset.", type=str)
+        dest='to_path', required=False,
+        help="Path to output directory for converted dataset (not needed for 'stats').", type=str)
     optional.add_argument(
         '--select-only-known-labels',
         help="only include labels known to the destination dataset (e.g skip 'trafficlight' if VOC doesn't know about it)",
@@ -78,15 +185,186 @@ def parse_args():
         action='store_true',
         default=False
     )
+    optional.add_argument(
+        '--namespace-ids',
+        dest='namespace_ids',
+        help="when merging several datasets, prefix image ids with the position of their --from, e.g '1-000042', "
+             "rather than failing if ids collide",
+        required=False,
+        action='store_true',
+        default=False
+    )
+    optional.add_argument(
+        '--link-images',
+        dest='link_images',
+        help="hard link images into the output rather than copying them, where possible (COCO only)",
+        required=False,
+        action='store_true',
+        default=False
+    )
+    optional.add_argument(
+        '--limit',
+        help="only read the first N (sampled) images",
+        required=False,
+        type=int,
+        default=None
+    )
+    optional.add_argument(
+        '--sample-fraction',
+        dest='sample_fraction',
+        help="only read roughly this fraction (0 to 1) of images, selected by a hash of their id so that the same "
+             "images are selected on every run",
+        required=False,
+        type=float,
+        default=None
+    )
+    optional.add_argument(
+        '--seed',
+        help="seed for --sample-fraction, to select a different subset",
+        required=False,
+        type=int,
+        default=0
+    )
+    optional.add_argument(
+        '--image-format',
+        dest='image_format',
+        help=f"re-encode images to this format: one of {', '.join(transcode.IMAGE_FORMATS)} "
+             "(VOC output is always JPEG)",
+        required=False,
+        choices=list(transcode.IMAGE_FORMATS),
+        default=None
+    )
+    optional.add_argument(
+        '--image-quality',
+        dest='image_quality',
+        help="JPEG quality (1 to 95) of re-encoded images",
+        required=False,
+        type=int,
+        default=90
+    )
+    optional.add_argument(
+        '--max-image-size',
+        dest='max_image_size',
+        help="downscale images wider or taller than this many pixels to fit, rescaling bounding boxes to match",
+        required=False,
+        type=int,
+        default=None
+    )
+    optional.add_argument(
+        '--poll-interval',
+        dest='poll_interval',
+        help="seconds between checks for new annotations with 'watch'",
+        required=False,
+        type=float,
+        default=1.0
+    )
+    optional.add_argument(
+        '--socket',
+        dest='socket_path',
+        help="Unix socket for 'serve' to listen on",
+        required=False,
+        type=str,
+        default=None
+    )
+    optional.add_argument(
+        '--port',
+        help="port on localhost for 'serve' to listen on, if no --socket is given",
+        required=False,
+        type=int,
+        default=8000
+    )
+    optional.add_argument(
+        '--workers',
+        help="when converting, how many threads read each dataset and processes transcode images: a number, "
+             "e.g 'ingest=4,transcode=2', or 'auto' to measure and choose during the first part of the run. "
+             f"How many requests 'serve' handles concurrently (default {SERVE_WORKERS})",
+        required=False,
+        type=str,
+        default=None
+    )
+    optional.add_argument(
+        '--report',
+        dest='report_path',
+        help="write a JSON report of the conversion to this path, including the --workers it used",
+        required=False,
+        type=str,
+        default=None
+    )
+    optional.add_argument(
+        '--memory-budget',
+        dest='memory_budget',
+        help="megabytes of memory images read ahead of being written may take up when converting, or of "
+             f"datasets 'serve' keeps in memory (default {SERVE_MEMORY_BUDGET // 1024 ** 2})",
+        required=False,
+        type=int,
+        default=None
+    )
+    optional.add_argument(
+        '--max-inflight-images',
+        dest='max_inflight_images',
+        help="how many images may be read ahead of being written when converting",
+        required=False,
+        type=int,
+        default=256
+    )
 
     args = parser.parse_args()
+    if args.command != 'serve':
+        required_args = [('--from', args.from_keys), ('--from-path', args.from_paths), ('--to', args.to_key)]
+        if args.command in ('convert', 'watch'):
+            required_args.append(('--to-path', args.to_path))
+        missing = [name for name, value in required_args if value is None]
+        if missing:
+            parser.error(f"the following arguments are required: {', '.join(missing)}")
+        if len(args.from_keys) != len(args.from_paths):
+            parser.error("expected a --from-path for each --from")
+        if args.command != 'convert' and len(args.from_keys) > 1:
+            parser.error(f"'{args.command}' reads a single dataset")
+        if args.command == 'watch' and args.from_keys[0] not in WATCH_FORMATS:
+            parser.error(f"'watch' supports --from {', '.join(WATCH_FORMATS)}")
+    if args.link_images and args.to_key != 'coco':
+        parser.error("--link-images is only supported with --to coco")
+    if args.limit is not None and args.limit < 0:
+        parser.error("--limit must not be negative")
+    if args.sample_fraction is not None and not 0 <= args.sample_fraction <= 1:
+        parser.error("--sample-fraction must be between 0 and 1")
+    required_format = EGESTORS[args.to_key].image_format() if args.to_key in EGESTORS else None
+    if args.image_format is not None and required_format not in (None, args.image_format):
+        parser.error(f"--to {args.to_key} requires --image-format {required_format}")
+    if not 1 <= args.image_quality <= 95:
+        parser.error("--image-quality must be between 1 and 95")
+    if args.max_image_size is not None and args.max_image_size < 10:
+        parser.error("--max-image-size must be at least 10")
+    if args.workers is not None:
+        try:
+            args.workers = autotune.parse_workers(args.workers)
+        except ValueError as e:
+            parser.error(f"--workers: {e}")
+        if args.command == 'serve' and not isinstance(args.workers, int):
+            parser.error("'serve' expects a number of --workers")
+        if isinstance(args.workers, dict) and not set(args.workers) <= set(autotune.STAGES):
+            parser.error(f"--workers: expected stages among {', '.join(autotune.STAGES)}")
     logging.info(args)
     return args
 
 
 if __name__ == '__main__':
     args = parse_args()
-    sys.exit(main(from_path=args.from_path, from_key=args.from_key,
+    sys.exit(main(from_paths=args.from_paths, from_keys=args.from_keys,
                   to_path=args.to_path, to_key=args.to_key,
                   select_only_known_labels=args.select_only_known_labels,
-                  filter_images_without_labels=args.filter_images_without_labels))
+                  filter_images_without_labels=args.filter_images_without_labels,
+                  command=args.command,
+                  sampler=converter.Sampler(fraction=args.sample_fraction, seed=args.seed, limit=args.limit),
+                  namespace_ids=args.namespace_ids,
+                  poll_interval=args.poll_interval,
+                  socket_path=args.socket_path,
+                  port=args.port,
+                  workers=args.workers,
+                  memory_budget=args.memory_budget and args.memory_budget * 1024 ** 2,
+                  max_inflight_images=args.max_inflight_images,
+                  image_format=args.image_format,
+                  image_quality=args.image_quality,
+                  max_image_size=args.max_image_size,
+                  report_path=args.report_path,
+                  link_images=args.link_images))
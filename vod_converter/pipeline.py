@@ -0,0 +1,143 @@
+"""
+Runs stages of a conversion concurrently, connected by bounded buffers.
+
+Producers (e.g ingesting a dataset) run in background threads and put what they produce into a `BoundedBuffer`,
+which blocks them once it holds too many items or too many bytes, until the consumer (e.g egesting) catches up.
+Reading source annotations thereby overlaps with writing output while memory use stays bounded.
+"""
+from collections import deque
+import threading
+
+_DONE = object()
+
+
+class _Failure:
+    def __init__(self, exception):
+        self.exception = exception
+
+
+class BoundedBuffer:
+    """
+    Thread safe FIFO that blocks producers while it holds max_items items or max_bytes bytes, whichever comes
+    first. A single item larger than max_bytes is still let through once no other items are buffered.
+
+    :param max_items: maximum number of items, or None for no limit
+    :param max_bytes: maximum total size of items as estimated by item_size, or None for no limit
+    :param item_size: function estimating the size of an item in bytes, needed with max_bytes
+    """
+
+    def __init__(self, *, max_items=None, max_bytes=None, item_size=None):
+        self.max_items = max_items
+        self.max_bytes = max_bytes
+        self.item_size = item_size
+        self._items = deque()
+        self._count = 0
+        self._bytes = 0
+        self._condition = threading.Condition()
+
+    def put(self, item, *, stop, sized=True):
+        """
+        Add an item, waiting for room.
+
+        :param stop: `threading.Event` to give up waiting on
+        :param sized: whether the item counts towards the limits
+        :return: whether the item was added
+        """
+        size = self.item_size(item) if sized and self.max_bytes is not None else 0
+        with self._condition:
+            while sized and self._count and self._is_full(size):
+                if stop.is_set():
+                    return False
+                self._condition.wait(0.1)
+            if stop.is_set():
+                return False
+            self._items.append((item, size, sized))
+            self._count += sized
+            self._bytes += size
+            self._condition.notify_all()
+            return True
+
+    def get(self):
+        """
+        Remove the oldest item, waiting for one to be added if empty.
+        """
+        with self._condition:
+            while not self._items:
+                self._condition.wait()
+            item, size, sized = self._items.popleft()
+            self._count -= sized
+            self._bytes -= size
+            self._condition.notify_all()
+            return item
+
+    def _is_full(self, size):
+        if self.max_items is not None and self._count >= self.max_items:
+            return True
+        return self.max_bytes is not None and self._bytes + size > self.max_bytes
+
+
+def iter_concurrently(producer_groups, *, max_items=None, max_bytes=None, item_size=None):
+    """
+    Run each producer in its own thread, yielding everything they produce in an order that doesn't depend on
+    timing: groups take turns, one item at a time, as do the producers within each group, e.g [[a, b], [c]]
+    yields a1, c1, b1, c2, a2, c3, ...
+
+    Each producer has its own `BoundedBuffer`, among which max_items and max_bytes are split evenly, so every
+    producer keeps working ahead of the consumer.
+
+    An exception raised by a producer is re-raised here, after which, or once the generator is closed early, the
+    producers are stopped and their threads joined.
+
+    :param producer_groups: lists of functions returning an iterable of items to yield
+    :param max_items: how many items all producers combined may get ahead of the consumer, or None for no limit
+    :param max_bytes: how many bytes, as estimated by item_size, producers may get ahead, or None for no limit
+    :param item_size: function estimating the size of an item in bytes, needed with max_bytes
+    """
+    producer_count = sum(len(producers) for producers in producer_groups)
+    buffer_groups = [
+        [BoundedBuffer(max_items=_split(max_items, producer_count), max_bytes=_split(max_bytes, producer_count),
+                       item_size=item_size)
+         for _ in producers]
+        for producers in producer_groups
+    ]
+    stop = threading.Event()
+    threads = [
+        threading.Thread(target=_produce, args=(producer, buffer, stop), daemon=True)
+        for producers, buffers in zip(producer_groups, buffer_groups)
+        for producer, buffer in zip(producers, buffers)
+    ]
+    for thread in threads:
+        thread.start()
+    try:
+        groups = deque(deque(buffers) for buffers in buffer_groups if buffers)
+        while groups:
+            buffers = groups.popleft()
+            while buffers:
+                buffer = buffers.popleft()
+                item = buffer.get()
+                if item is _DONE:
+                    continue
+                if isinstance(item, _Failure):
+                    raise item.exception
+                buffers.append(buffer)
+                groups.append(buffers)
+                yield item
+                break
+    finally:
+        stop.set()
+        for thread in threads:
+            thread.join()
+
+
+def _split(limit, count):
+    return None if limit is None else max(1, limit // count)
+
+
+def _produce(producer, buffer, stop):
+    try:
+        for item in producer():
+            if not buffer.put(item, stop=stop):
+                return
+        buffer.put(_DONE, stop=stop, sized=False)
+    except Exception as e:
+        buffer.put(_Failure(e), stop=stop, sized=False)
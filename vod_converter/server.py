@@ -0,0 +1,288 @@
+"""
+Long running conversion server keeping ingested datasets in memory, so that repeated conversions of the same
+source only pay for egesting.
+
+Listens for HTTP requests on a Unix socket or a local TCP port; no network access is needed. Requests and
+responses are JSON:
+
+    POST /convert  {"from": "kitti", "from_path": "...", "to": "voc", "to_path": "...",
+                    "select_only_known_labels": false, "filter_images_without_labels": false,
+                    "limit": null, "sample_fraction": null, "seed": 0,
+                    "image_format": null, "image_quality": 90, "max_image_size": null}
+    POST /subset   same as /convert, but requires "limit" and/or "sample_fraction"
+    POST /stats    same as /convert, without "to_path" and "filter_images_without_labels"; see `stats.py`
+    GET /datasets  datasets in memory and their estimated size
+    POST /evict    {"from": "kitti", "from_path": "..."} to drop a dataset, or {} to drop all of them
+
+Every response has "success" and "message" keys. Datasets are ingested and validated in full the first time
+they're requested and evicted least recently used first once their estimated size exceeds the memory budget.
+Requests are handled by a bounded pool of worker threads; further requests wait for a free worker.
+"""
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import copy
+import http.server
+import json
+import logging
+import os
+import shutil
+import socketserver
+import tempfile
+import threading
+
+import converter
+import stats
+import transcode
+
+logger = logging.getLogger(__name__)
+
+
+class DatasetCache:
+    """
+    Ingested, validated datasets keyed by (ingestor key, path), evicted least recently used first.
+
+    :param memory_budget: bytes the datasets' estimated sizes may add up to
+    """
+
+    def __init__(self, *, memory_budget):
+        self.memory_budget = memory_budget
+        self._datasets = OrderedDict()
+        self._lock = threading.Lock()
+        self._loading_locks = {}
+
+    def get(self, *, from_key, from_path, ingestor):
+        """
+        :return: the dataset's image detections, ingesting them if not in memory. They must not be modified.
+        """
+        key = (from_key, from_path)
+        with self._lock:
+            loading_lock = self._loading_locks.setdefault(key, threading.Lock())
+        with loading_lock:
+            with self._lock:
+                if key in self._datasets:
+                    self._datasets.move_to_end(key)
+                    return self._datasets[key][0]
+
+            from_valid, from_msg = ingestor.validate(from_path)
+            if not from_valid:
+                raise ValueError(from_msg)
+            image_detections = ingestor.ingest(from_path)
+            converter.validate_image_detections(image_detections)
+            size = converter.estimate_size(image_detections)
+            logger.info(f"Ingested {len(image_detections)} images from {from_key} {from_path}, ~{size} bytes")
+
+            with self._lock:
+                if size <= self.memory_budget:
+                    self._datasets[key] = (image_detections, size)
+                    self._evict_over_budget()
+            return image_detections
+
+    def evict(self, *, from_key=None, from_path=None):
+        """
+        Evict a dataset, or all datasets if no key is given.
+        """
+        with self._lock:
+            if from_key is None:
+                self._datasets.clear()
+            else:
+                self._datasets.pop((from_key, from_path), None)
+
+    def sizes(self):
+        with self._lock:
+            return [(from_key, from_path, size) for (from_key, from_path), (_, size) in self._datasets.items()]
+
+    def _evict_over_budget(self):
+        total = sum(size for _, size in self._datasets.values())
+        while total > self.memory_budget:
+            key, (_, size) = self._datasets.popitem(last=False)
+            logger.info(f"Evicted {key[0]} {key[1]} from memory")
+            total -= size
+
+
+class ConversionService:
+    """
+    Handles requests against datasets in a `DatasetCache`, using the given formats.
+
+    :param ingestors: dict of format key to `converter.Ingestor`
+    :param egestors: dict of format key to `converter.Egestor`
+    :param cache: `DatasetCache`
+    """
+
+    def __init__(self, *, ingestors, egestors, cache):
+        self.ingestors = ingestors
+        self.egestors = egestors
+        self.cache = cache
+
+    def convert(self, params):
+        image_detections = self._selected_image_detections(params)
+        egestor = self._egestor(params)
+        image_detections = converter.convert_labels(
+            image_detections=(copy.deepcopy(image_detection) for image_detection in image_detections),
+            expected_labels=egestor.expected_labels(),
+            select_only_known_labels=params.get('select_only_known_labels', False),
+            filter_images_without_labels=params.get('filter_images_without_labels', False))
+        to_path = _required(params, 'to_path')
+        image_format = params.get('image_format')
+        if image_format and egestor.image_format() not in (None, image_format):
+            raise ValueError(f"Format {params['to']} requires image_format {egestor.image_format()}")
+        image_format = image_format or egestor.image_format()
+        transcoder = None
+        if image_format or params.get('max_image_size'):
+            transcoder = transcode.Transcoder(image_format=image_format,
+                                              quality=params.get('image_quality', 90),
+                                              max_size=params.get('max_image_size'))
+        if transcoder is None:
+            egestor.egest(image_detections=image_detections, root=to_path)
+            return {'images': len(image_detections)}
+
+        os.makedirs(to_path, exist_ok=True)
+        transcoded_path = tempfile.mkdtemp(prefix='.transcode-', dir=to_path)
+        try:
+            egestor.egest(image_detections=transcoder.transcode(image_detections, out_dir=transcoded_path),
+                          root=to_path)
+        finally:
+            shutil.rmtree(transcoded_path, ignore_errors=True)
+        return {'images': len(image_detections)}
+
+    def subset(self, params):
+        if params.get('limit') is None and params.get('sample_fraction') is None:
+            raise ValueError("Expected 'limit' and/or 'sample_fraction'")
+        return self.convert(params)
+
+    def stats(self, params):
+        return stats.compute_stats(
+            image_detections=self._selected_image_detections(params),
+            expected_labels=self._egestor(params).expected_labels(),
+            select_only_known_labels=params.get('select_only_known_labels', False))
+
+    def datasets(self, params):
+        return {'datasets': [{'from': from_key, 'from_path': from_path, 'size': size}
+                             for from_key, from_path, size in self.cache.sizes()]}
+
+    def evict(self, params):
+        if 'from' in params:
+            self.cache.evict(from_key=params['from'], from_path=_required(params, 'from_path'))
+        else:
+            self.cache.evict()
+        return {}
+
+    def _selected_image_detections(self, params):
+        from_key = _required(params, 'from')
+        if from_key not in self.ingestors:
+            raise ValueError(f"Unknown format to convert from: {from_key}")
+        image_detections = self.cache.get(from_key=from_key, from_path=_required(params, 'from_path'),
+                                          ingestor=self.ingestors[from_key])
+        sampler = converter.Sampler(fraction=params.get('sample_fraction'), seed=params.get('seed', 0),
+                                    limit=params.get('limit'))
+        return sampler.select(image_detections, key=lambda image_detection: image_detection['image']['id'])
+
+    def _egestor(self, params):
+        to_key = _required(params, 'to')
+        if to_key not in self.egestors:
+            raise ValueError(f"Unknown format to convert to: {to_key}")
+        return self.egestors[to_key]
+
+
+def _required(params, key):
+    if params.get(key) is None:
+        raise ValueError(f"Expected '{key}'")
+    return params[key]
+
+
+ROUTES = {
+    ('POST', '/convert'): ConversionService.convert,
+    ('POST', '/subset'): ConversionService.subset,
+    ('POST', '/stats'): ConversionService.stats,
+    ('GET', '/datasets'): ConversionService.datasets,
+    ('POST', '/evict'): ConversionService.evict,
+}
+
+
+class _RequestHandler(http.server.BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        self._handle('GET')
+
+    def do_POST(self):
+        self._handle('POST')
+
+    def address_string(self):
+        # Unix socket clients have no address
+        return self.client_address[0] if self.client_address else 'local'
+
+    def _handle(self, method):
+        route = ROUTES.get((method, self.path))
+        if route is None:
+            self._respond(404, {'success': False, 'message': f"No such endpoint: {method} {self.path}"})
+            return
+        try:
+            content_length = int(self.headers.get('Content-Length') or 0)
+            params = json.loads(self.rfile.read(content_length) or b'{}')
+            result = route(self.server.service, params)
+        except (ValueError, KeyError) as e:
+            self._respond(400, {'success': False, 'message': str(e)})
+            return
+        except Exception as e:
+            logger.exception(f"Failed to handle {method} {self.path}")
+            self._respond(500, {'success': False, 'message': str(e)})
+            return
+        self._respond(200, {'success': True, 'message': '', **result})
+
+    def _respond(self, status, body):
+        payload = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+
+class _PooledServerMixIn:
+    """
+    Handle each request on a bounded pool of threads rather than a new thread per request.
+    """
+
+    def process_request(self, request, client_address):
+        self.executor.submit(self._process_pooled_request, request, client_address)
+
+    def _process_pooled_request(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+
+    def server_close(self):
+        super().server_close()
+        self.executor.shutdown(wait=True)
+
+
+class _TCPServer(_PooledServerMixIn, http.server.HTTPServer):
+    pass
+
+
+class _UnixServer(_PooledServerMixIn, socketserver.UnixStreamServer):
+    pass
+
+
+def make_server(*, ingestors, egestors, socket_path=None, port=None, workers=4, memory_budget=2 * 1024 ** 3):
+    """
+    Create a server listening on a Unix socket or on a port of localhost. Call `serve_forever` on it to handle
+    requests and `shutdown` from another thread to stop.
+
+    :param ingestors: dict of format key to `converter.Ingestor`
+    :param egestors: dict of format key to `converter.Egestor`
+    :param socket_path: '/path/to/socket', or None to listen on port
+    :param port: port on 127.0.0.1, 0 for any free port
+    :param workers: how many requests are handled concurrently
+    :param memory_budget: bytes of memory datasets may take up
+    """
+    if socket_path is not None:
+        server = _UnixServer(socket_path, _RequestHandler)
+    else:
+        server = _TCPServer(('127.0.0.1', port or 0), _RequestHandler)
+    server.executor = ThreadPoolExecutor(workers)
+    server.service = ConversionService(ingestors=ingestors, egestors=egestors,
+                                       cache=DatasetCache(memory_budget=memory_budget))
+    return server
@@ -0,0 +1,148 @@
+"""
+Summarizes a dataset without converting it.
+
+Useful to decide on `--select-only-known-labels` and `--filter-images-without-labels` before running a
+conversion: label counts are reported both as found in the source and after mapping them onto the labels
+expected by the destination format (see `converter.Egestor.expected_labels`).
+
+Statistics are aggregated in a single pass over `converter.Ingestor.iter_ingest`, keeping only counters
+around, so memory use does not grow with the size of the dataset and no images are copied.
+"""
+from collections import Counter
+import math
+
+from converter import label_conversions
+
+
+class Distribution:
+    """
+    Running summary of a stream of non-negative numbers: count, min, max, mean and a histogram with
+    power-of-two bucket edges, e.g '16-32' counts values v with 16 <= v < 32.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+        self.buckets = Counter()
+
+    def add(self, value):
+        self.count += 1
+        self.total += value
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+        self.buckets[_bucket_exponent(value)] += 1
+
+    def as_dict(self):
+        return {
+            'count': self.count,
+            'min': self.min,
+            'max': self.max,
+            'mean': self.total / self.count if self.count else None,
+            'histogram': {_bucket_name(exponent): self.buckets[exponent] for exponent in sorted(self.buckets)}
+        }
+
+
+def _bucket_exponent(value):
+    if value < 1:
+        return None
+    return int(math.log2(value))
+
+
+def _bucket_name(exponent):
+    if exponent is None:
+        return '0-1'
+    return f"{2 ** exponent}-{2 ** (exponent + 1)}"
+
+
+def compute_stats(*, image_detections, expected_labels, select_only_known_labels):
+    """
+    Aggregate statistics over image detections.
+
+    Bounds are checked the same way `converter.validate_image_detections` does, but offending detections
+    are counted rather than raising.
+
+    :param image_detections: an iterable of dicts conforming to `IMAGE_DETECTION_SCHEMA`
+    :param expected_labels: labels of the destination format, see `converter.Egestor.expected_labels`
+    :param select_only_known_labels: whether labels unknown to the destination would be dropped
+    :return: a JSON serializable dict
+    """
+    convert_dict = label_conversions(expected_labels)
+
+    images = 0
+    images_without_labels = 0
+    images_without_known_labels = 0
+    images_with_out_of_bounds = 0
+    detections = 0
+    out_of_bounds = 0
+    zero_dimension = 0
+    source_labels = Counter()
+    converted_labels = Counter()
+    unknown_labels = Counter()
+    box_widths = Distribution()
+    box_heights = Distribution()
+    box_areas = Distribution()
+    image_widths = Distribution()
+    image_heights = Distribution()
+
+    for image_detection in image_detections:
+        image = image_detection['image']
+        image_width, image_height = image['width'], image['height']
+        images += 1
+        image_widths.add(image_width)
+        image_heights.add(image_height)
+
+        image_out_of_bounds = False
+        known = 0
+        for detection in image_detection['detections']:
+            detections += 1
+            label = detection['label']
+            source_labels[label] += 1
+            final_label = convert_dict.get(label.lower())
+            if final_label is None:
+                unknown_labels[label] += 1
+                if not select_only_known_labels:
+                    converted_labels[label] += 1
+            else:
+                known += 1
+                converted_labels[final_label] += 1
+
+            if detection['right'] >= image_width or detection['bottom'] >= image_height:
+                out_of_bounds += 1
+                image_out_of_bounds = True
+            width = detection['right'] - detection['left']
+            height = detection['bottom'] - detection['top']
+            if width <= 0 or height <= 0:
+                zero_dimension += 1
+                continue
+            box_widths.add(width)
+            box_heights.add(height)
+            box_areas.add(width * height)
+
+        if not image_detection['detections']:
+            images_without_labels += 1
+        if not known:
+            images_without_known_labels += 1
+        if image_out_of_bounds:
+            images_with_out_of_bounds += 1
+
+    return {
+        'images': images,
+        'images_without_labels': images_without_labels,
+        'images_without_known_labels': images_without_known_labels,
+        'images_with_out_of_bounds_detections': images_with_out_of_bounds,
+        'detections': detections,
+        'out_of_bounds_detections': out_of_bounds,
+        'zero_dimension_detections': zero_dimension,
+        'source_labels': dict(source_labels.most_common()),
+        'converted_labels': dict(converted_labels.most_common()),
+        'unknown_labels': dict(unknown_labels.most_common()),
+        'box_width': box_widths.as_dict(),
+        'box_height': box_heights.as_dict(),
+        'box_area': box_areas.as_dict(),
+        'image_width': image_widths.as_dict(),
+        'image_height': image_heights.as_dict(),
+    }
@@ -0,0 +1,150 @@
+"""
+Streams a dataset in the common format to in-process consumers such as training loaders, without writing a
+converted copy to disk first.
+
+    stream = RecordStream(from_path='datasets/mydata-kitti', ingestor=kitti.KITTIIngestor(),
+                          expected_labels={'car': [], 'person': ['pedestrian']},
+                          select_only_known_labels=True, shuffle_buffer=1000)
+    for epoch in range(10):
+        for image_detection in stream.iter_epoch(epoch):
+            ...
+
+Records go through the same validation and label conversion as `converter.convert`. Ingestion runs in
+background threads that stay at most `prefetch` records ahead of the consumer, so memory use does not grow
+with the size of the dataset.
+"""
+import array
+from collections import namedtuple
+import functools
+import itertools
+import random
+import threading
+
+import converter
+import pipeline
+
+CompactRecord = namedtuple('CompactRecord', ['id', 'path', 'width', 'height', 'label_ids', 'boxes'])
+CompactRecord.__doc__ = """
+An image detection packed into arrays: `label_ids` holds one index into `RecordStream.categories` per detection
+and `boxes` the corresponding left, top, right, bottom coordinates, four floats per detection.
+"""
+
+
+class RecordStream:
+    """
+    Iterable over validated, label converted image detections of a dataset.
+
+    :param from_path: '/path/to/read/from'
+    :param ingestor: `converter.Ingestor` to read in data
+    :param expected_labels: labels to convert to, as returned by `converter.Egestor.expected_labels`
+    :param select_only_known_labels: drop detections with labels not in expected_labels
+    :param filter_images_without_labels: drop images without any (known) labels
+    :param sampler: optional `converter.Sampler` to stream only a subset of images
+    :param compact: yield `CompactRecord`s rather than dicts conforming to `IMAGE_DETECTION_SCHEMA`
+    :param prefetch: how many records background ingestion may get ahead of the consumer
+    :param workers: how many threads to ingest with, each reading a disjoint shard of the dataset, if the
+        ingestor is `converter.Ingestor.shardable`. With more than one worker records of the shards take turns, so
+        the order depends on the number of workers. Ignored if sampler has a limit, so that the same records are
+        selected regardless.
+    :param shuffle_buffer: if > 0, shuffle records within a sliding window of this many records, differently
+        each epoch
+    :param seed: seed for shuffling
+    """
+
+    def __init__(self, *, from_path, ingestor, expected_labels, select_only_known_labels=False,
+                 filter_images_without_labels=False, sampler=None, compact=False, prefetch=64, workers=1,
+                 shuffle_buffer=0, seed=0):
+        from_valid, from_msg = ingestor.validate(from_path)
+        if not from_valid:
+            raise ValueError(from_msg)
+        self.from_path = from_path
+        self.ingestor = ingestor
+        self.expected_labels = expected_labels
+        self.select_only_known_labels = select_only_known_labels
+        self.filter_images_without_labels = filter_images_without_labels
+        self.label_filter = converter.LabelFilter(expected_labels=expected_labels,
+                                                  select_only_known_labels=select_only_known_labels,
+                                                  filter_images_without_labels=filter_images_without_labels)
+        self.sampler = sampler or converter.Sampler()
+        self.compact = compact
+        self.prefetch = prefetch
+        self.workers = workers if ingestor.shardable() and self.sampler.limit is None else 1
+        self.shuffle_buffer = shuffle_buffer
+        self.seed = seed
+
+        self.categories = list(expected_labels)
+        self._category_ids = {label: idx for idx, label in enumerate(self.categories)}
+        self._categories_lock = threading.Lock()
+
+    def __iter__(self):
+        return self.iter_epoch(0)
+
+    def iter_epoch(self, epoch):
+        """
+        :param epoch: selects the shuffled order, if shuffling
+        :return: a generator of records; closing it early stops background ingestion
+        """
+        records = self._iter_prefetched()
+        try:
+            limited = itertools.islice(records, self.sampler.limit)
+            if self.shuffle_buffer:
+                rng = random.Random(f"{self.seed}:{epoch}")
+                yield from _shuffled(limited, buffer_size=self.shuffle_buffer, rng=rng)
+            else:
+                yield from limited
+        finally:
+            records.close()
+
+    def _iter_prefetched(self):
+        producers = [functools.partial(self._iter_shard, self.sampler.sharded(idx, self.workers))
+                     for idx in range(self.workers)]
+        return pipeline.iter_concurrently([producers], max_items=self.prefetch)
+
+    def _iter_shard(self, sampler):
+        image_detections = self.ingestor.iter_ingest(self.from_path, sampler=sampler, label_filter=self.label_filter)
+        for image_detection in image_detections:
+            record = self._to_record(image_detection)
+            if record is not None:
+                yield record
+
+    def _to_record(self, image_detection):
+        converter.validate_image_detections([image_detection])
+        converted = converter.convert_image_labels(image_detection, label_filter=self.label_filter)
+        if converted is None:
+            return None
+        if self.compact:
+            return self._to_compact(converted)
+        return converted
+
+    def _to_compact(self, image_detection):
+        image = image_detection['image']
+        label_ids = array.array('H')
+        boxes = array.array('f')
+        for detection in image_detection['detections']:
+            label_ids.append(self._category_id(detection['label']))
+            boxes.extend((detection['left'], detection['top'], detection['right'], detection['bottom']))
+        return CompactRecord(image['id'], image['path'], image['width'], image['height'], label_ids, boxes)
+
+    def _category_id(self, label):
+        category_id = self._category_ids.get(label)
+        if category_id is None:
+            with self._categories_lock:
+                category_id = self._category_ids.get(label)
+                if category_id is None:
+                    category_id = len(self.categories)
+                    self.categories.append(label)
+                    self._category_ids[label] = category_id
+        return category_id
+
+
+def _shuffled(records, *, buffer_size, rng):
+    buffer = []
+    for record in records:
+        if len(buffer) < buffer_size:
+            buffer.append(record)
+            continue
+        idx = rng.randrange(buffer_size)
+        yield buffer[idx]
+        buffer[idx] = record
+    rng.shuffle(buffer)
+    yield from buffer
@@ -0,0 +1,168 @@
+"""
+Re-encodes images to another format and/or downscales them on their way to the egestor, e.g because VOC
+consumers expect JPEGs or to get smaller images for quick experiments.
+
+Images are transcoded on a pool of processes, one per core by default, at most a few images ahead of the
+egestor. Processes are spawned rather than forked where Python supports it (3.7 and later), so scripts converting
+through `converter.convert` need an `if __name__ == '__main__':` guard whenever images are transcoded, which
+includes converting PNG datasets to VOC. When downscaling JPEGs, PIL's `draft` decodes them at a reduced resolution to begin with. Image
+dimensions, bounding boxes and segmentation masks are rescaled to match; images that need neither re-encoding nor
+resizing are passed through as they are.
+"""
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
+import os
+import time
+
+from PIL import Image
+
+# format name to (PIL format, file extensions, first one being used for transcoded images)
+IMAGE_FORMATS = {
+    'jpeg': ('JPEG', ['jpg', 'jpeg']),
+    'png': ('PNG', ['png']),
+}
+
+
+class Transcoder:
+    """
+    :param image_format: 'jpeg' or 'png' to re-encode images in any other format, or None to keep their format
+    :param quality: JPEG quality, 1 to 95
+    :param max_size: downscale images whose width or height exceeds this many pixels to fit, or None
+    :param workers: how many processes to transcode with, or None for one per core
+    """
+
+    def __init__(self, *, image_format=None, quality=90, max_size=None, workers=None):
+        if image_format is not None and image_format not in IMAGE_FORMATS:
+            raise ValueError(f"Unknown image format: {image_format}")
+        self.image_format = image_format
+        self.quality = quality
+        self.max_size = max_size
+        self.workers = workers or os.cpu_count() or 1
+
+    def with_format(self, image_format):
+        """
+        :return: this transcoder if it re-encodes to image_format, otherwise a copy of it that does
+        """
+        if self.image_format == image_format:
+            return self
+        return Transcoder(image_format=image_format, quality=self.quality, max_size=self.max_size,
+                          workers=self.workers)
+
+    def transcode(self, image_detections, *, out_dir, tuner=None):
+        """
+        Lazily transcode the images of image detections into out_dir, in order.
+
+        :param out_dir: '/path/to/write/transcoded/images/to', which must outlive egesting them
+        :param tuner: optional `autotune.Tuner` measuring transcoding and limiting how many processes are active
+        :return: a generator of the image detections, updated to refer to transcoded images
+        """
+        throttle = tuner.stage('transcode', workers=self.workers) if tuner is not None else None
+        with _process_pool(self.workers) as executor:
+            pending = deque()
+            try:
+                for idx, image_detection in enumerate(image_detections):
+                    future = None
+                    if self._may_transcode(image_detection['image']['path']):
+                        future = executor.submit(
+                            transcode_image, image_detection['image']['path'], f"{out_dir}/{idx}",
+                            segmented_path=image_detection['image']['segmented_path'],
+                            image_format=self.image_format, quality=self.quality, max_size=self.max_size)
+                    pending.append((image_detection, future, time.monotonic()))
+                    # with a throttle, only as many images as active processes are in flight
+                    while len(pending) > (throttle.limit if throttle is not None else 2 * self.workers):
+                        yield self._next_transcoded(pending, tuner)
+                while pending:
+                    yield self._next_transcoded(pending, tuner)
+            finally:
+                for _, future, _ in pending:
+                    if future is not None:
+                        future.cancel()
+
+    def _next_transcoded(self, pending, tuner):
+        image_detection, future, submitted_at = pending.popleft()
+        transcoded = _transcoded(image_detection, future)
+        if future is not None and tuner is not None:
+            tuner.observe('transcode', time.monotonic() - submitted_at)
+        return transcoded
+
+    def _may_transcode(self, path):
+        if self.max_size is not None:
+            return True
+        if self.image_format is None:
+            return False
+        return path.split('.')[-1].lower() not in IMAGE_FORMATS[self.image_format][1]
+
+
+def _process_pool(workers):
+    try:
+        # not forking, as ingestion threads may hold locks at the time
+        return ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context('spawn'))
+    except TypeError:
+        # Python 3.6 can't choose how processes are started
+        return ProcessPoolExecutor(workers)
+
+
+def transcode_image(path, out_path_prefix, *, segmented_path=None, image_format, quality, max_size):
+    """
+    Transcode an image if it's not in image_format or larger than max_size. Its segmentation mask, if any, is
+    resized along with it.
+
+    :param out_path_prefix: where to write the transcoded image to, without extension
+    :param segmented_path: '/path/to/segmentation/mask.png' or None
+    :return: (path of the resulting image, which is path if left as it is, path of the resulting segmentation mask,
+        original (width, height), resulting (width, height))
+    """
+    with Image.open(path) as image:
+        width, height = image.size
+        scale = min(1, max_size / max(width, height)) if max_size is not None else 1
+        size = (max(1, round(width * scale)), max(1, round(height * scale)))
+        target_format = image_format or _format_name(image.format)
+        pil_format, extensions = IMAGE_FORMATS[target_format]
+        if size == (width, height) and image.format == pil_format:
+            return path, segmented_path, (width, height), size
+
+        if size != (width, height):
+            # JPEGs are decoded at the smallest reduced scale still at least as large as size
+            image.draft('RGB', size)
+            transcoded = image.resize(size, Image.LANCZOS)
+        else:
+            transcoded = image.copy()
+        if pil_format == 'JPEG' and transcoded.mode not in ('RGB', 'L'):
+            transcoded = transcoded.convert('RGB')
+        out_path = f"{out_path_prefix}.{extensions[0]}"
+        transcoded.save(out_path, pil_format, quality=quality)
+
+    if segmented_path is not None and size != (width, height):
+        with Image.open(segmented_path) as mask:
+            # nearest neighbour keeps mask values, e.g object indices, as they are
+            out_segmented_path = f"{out_path_prefix}-segmented.png"
+            mask.resize(size, Image.NEAREST).save(out_segmented_path, 'PNG')
+        segmented_path = out_segmented_path
+    return out_path, segmented_path, (width, height), size
+
+
+def _format_name(pil_format):
+    for name, (format_pil, _) in IMAGE_FORMATS.items():
+        if format_pil == pil_format:
+            return name
+    raise ValueError(f"Can't write images in {pil_format} format")
+
+
+def _transcoded(image_detection, future):
+    if future is None:
+        return image_detection
+    path, segmented_path, (width, height), (out_width, out_height) = future.result()
+    if path == image_detection['image']['path']:
+        return image_detection
+
+    scale_x = out_width / width
+    scale_y = out_height / height
+    for detection in image_detection['detections']:
+        detection['left'] *= scale_x
+        detection['right'] = min(detection['right'] * scale_x, out_width - 1)
+        detection['top'] *= scale_y
+        detection['bottom'] = min(detection['bottom'] * scale_y, out_height - 1)
+    image_detection['image'] = dict(image_detection['image'], path=path, segmented_path=segmented_path,
+                                    width=out_width, height=out_height)
+    return image_detection
@@ -7,12 +7,11 @@ https://github.com/udacity/self-driving-car/tree/master/annotations
 import csv
 import glob
 import os
-from PIL import Image
 
 from collections import defaultdict
 
 
-from converter import Ingestor
+from converter import Ingestor, LabelFilter, LazyImage, Sampler, clamp_to_image
 
 
 class UdacityCrowdAIIngestor(Ingestor):
@@ -23,7 +22,7 @@ class UdacityCrowdAIIngestor(Ingestor):
             return False, f"Expected to find {labels_path}"
         return True, None
 
-    def ingest(self, root):
+    def iter_ingest(self, root, *, sampler=None, label_filter=None):
         labels_path = f"{root}/labels.csv"
         image_labels = defaultdict(list)
 
@@ -33,50 +32,19 @@ class UdacityCrowdAIIngestor(Ingestor):
             for idx, row in enumerate(labels_csv):
                 image_labels[row[4]].append(row)
 
-        image_detections = []
-        for idx, image_path in enumerate(glob.glob(f"{root}/*.jpg")):
-            f_name = image_path.split("/")[-1]
-            f_image_labels = image_labels[f_name]
-            fname_id = f_name.split('.')[0]
+        def parse_detection(image_label):
+            x1, y1, x2, y2 = map(float, image_label[0:4])
+            label = image_label[5]
+            return {
+                'label': label,
+                'left': x1,
+                'right': x2,
+                'top': y1,
+                'bottom': y2
+            }
 
-            image_width, image_height = _image_dimensions(image_path)
-
-            def clamp_bbox(det):
-                if det['right'] > image_width - 1:
-                    det['right'] = image_width - 1
-                if det['bottom'] > image_height - 1:
-                    det['bottom'] = image_height - 1
-                return det
-
-            def valid_bbox(det):
-                return det['right'] > det['left'] and det['bottom'] > det['top']
-
-            detections = []
-
-            for image_label in f_image_labels:
-                x1, y1, x2, y2 = map(float, image_label[0:4])
-                label = image_label[5]
-                detections.append({
-                    'label': label,
-                    'left': x1,
-                    'right': x2,
-                    'top': y1,
-                    'bottom': y2
-                })
-
-            filtered_detections = [clamp_bbox(det) for det in detections if valid_bbox(det)]
-            if filtered_detections:
-                image_detections.append({
-                    'image': {
-                        'id': fname_id,
-                        'path': image_path,
-                        'segmented_path': None,
-                        'width': image_width,
-                        'height': image_height
-                    },
-                    'detections': filtered_detections
-                })
-        return image_detections
+        yield from _iter_image_detections(root, image_labels, parse_detection,
+                                          sampler=sampler or Sampler(), label_filter=label_filter or LabelFilter())
 
 
 class UdacityAuttiIngestor(Ingestor):
@@ -86,7 +54,7 @@ class UdacityAuttiIngestor(Ingestor):
             return False, f"Expected to find {labels_path}"
         return True, None
 
-    def ingest(self, root):
+    def iter_ingest(self, root, *, sampler=None, label_filter=None):
         labels_path = f"{root}/labels.csv"
         image_labels = defaultdict(list)
 
@@ -96,52 +64,50 @@ class UdacityAuttiIngestor(Ingestor):
             for idx, row in enumerate(labels_csv):
                 image_labels[row[0]].append(row)
 
-        image_detections = []
-        for idx, image_path in enumerate(glob.glob(f"{root}/*.jpg")):
+        def parse_detection(image_label):
+            x1, y1, x2, y2, x, label = image_label[1:7]
+            x1, y1, x2, y2 = map(float, (x1, y1, x2, y2))
+            return {
+                'label': label,
+                'left': x1,
+                'right': x2,
+                'top': y1,
+                'bottom': y2
+            }
+
+        yield from _iter_image_detections(root, image_labels, parse_detection,
+                                          sampler=sampler or Sampler(), label_filter=label_filter or LabelFilter())
+
+
+def _iter_image_detections(root, image_labels, parse_detection, *, sampler, label_filter):
+    """
+    Yield image detections for images in root that have valid labels and are selected by the sampler and kept
+    by the label filter. Bounding boxes are clamped to the image once its dimensions are read.
+    """
+    def valid_bbox(det):
+        return det['right'] > det['left'] and det['bottom'] > det['top']
+
+    def candidates():
+        for image_path in sorted(glob.glob(f"{root}/*.jpg")):
             f_name = image_path.split("/")[-1]
-            f_image_labels = image_labels[f_name]
             fname_id = f_name.split('.')[0]
-
-            image_width, image_height = _image_dimensions(image_path)
-
-            def clamp_bbox(det):
-                if det['right'] > image_width - 1:
-                    det['right'] = image_width - 1
-                if det['bottom'] > image_height - 1:
-                    det['bottom'] = image_height - 1
-                return det
-
-            def valid_bbox(det):
-                return det['right'] > det['left'] and det['bottom'] > det['top']
-
-            detections = []
-
-            for image_label in f_image_labels:
-                x1, y1, x2, y2, x, label = image_label[1:7]
-                x1, y1, x2, y2 = map(float, (x1, y1, x2, y2))
-                detections.append({
-                    'label': label,
-                    'left': x1,
-                    'right': x2,
-                    'top': y1,
-                    'bottom': y2
-                })
-
-            filtered_detections = [clamp_bbox(det) for det in detections if valid_bbox(det)]
-            if filtered_detections:
-                image_detections.append({
-                    'image': {
-                        'id': fname_id,
-                        'path': image_path,
-                        'segmented_path': None,
-                        'width': image_width,
-                        'height': image_height
-                    },
-                    'detections': filtered_detections
-                })
-        return image_detections
-
-
-def _image_dimensions(path):
-    with Image.open(path) as image:
-        return image.width, image.height
\ No newline at end of file
+            if not sampler.includes(fname_id):
+                continue
+            detections = [parse_detection(image_label) for image_label in image_labels[f_name]]
+            valid_detections = [det for det in detections if valid_bbox(det)]
+            if not valid_detections:
+                continue
+            kept_detections = label_filter.filter_detections(valid_detections)
+            if label_filter.keeps_image(kept_detections):
+                yield fname_id, image_path, kept_detections
+
+    for fname_id, image_path, detections in sampler.take(candidates()):
+        yield {
+            'image': LazyImage(
+                id=fname_id,
+                path=image_path,
+                segmented_path=None,
+                on_dimensions=clamp_to_image(detections)
+            ),
+            'detections': detections
+        }
@@ -7,7 +7,7 @@ http://host.robots.ox.ac.uk/pascal/VOC/voc2012/htmldoc/index.html
 import os
 import shutil
 
-from converter import Ingestor, Egestor
+from converter import Ingestor, Egestor, LabelFilter, Sampler, file_stamps
 import xml.etree.ElementTree as ET
 
 
@@ -21,9 +21,21 @@ class VOCIngestor(Ingestor):
                 return False, f"Expected main image set ImageSets/Main/trainval.txt to exist within {path}"
         return True, None
 
-    def ingest(self, path):
+    def iter_ingest(self, path, *, sampler=None, label_filter=None):
+        sampler = sampler or Sampler()
+        label_filter = label_filter or LabelFilter()
         image_names = self._get_image_ids(path)
-        return [self._get_image_detection(path, image_name) for image_name in image_names]
+        image_detections = (self._get_image_detection(path, image_name, label_filter=label_filter)
+                            for image_name in image_names if sampler.includes(image_name))
+        yield from sampler.take(image_detection for image_detection in image_detections if image_detection)
+
+    def shardable(self):
+        return True
+
+    def watch_index(self, path):
+        annotation_stamps = file_stamps(f"{path}/VOC2012/Annotations", suffix='.xml')
+        return {image_id: annotation_stamps[image_id]
+                for image_id in self._get_image_ids(path) if image_id in annotation_stamps}
 
     def _get_image_ids(self, root):
         path = f"{root}/VOC2012"
@@ -38,16 +50,23 @@ class VOCIngestor(Ingestor):
                 fnames.append(cols[0])
             return fnames
 
-    def _get_image_detection(self, root, image_id):
+    def _get_image_detection(self, root, image_id, *, label_filter):
+        """
+        :return: the image detection, or None if `label_filter` drops the image
+        """
         path = f"{root}/VOC2012"
-        image_path = f"{path}/JPEGImages/{image_id}.jpg"
-        if not os.path.isfile(image_path):
-            raise Exception(f"Expected {image_path} to exist.")
         annotation_path = f"{path}/Annotations/{image_id}.xml"
         if not os.path.isfile(annotation_path):
             raise Exception(f"Expected annotation file {annotation_path} to exist.")
         tree = ET.parse(annotation_path)
         xml_root = tree.getroot()
+        detections = label_filter.filter_detections(
+            [self._get_detection(node) for node in xml_root.findall('object')])
+        if not label_filter.keeps_image(detections):
+            return None
+        image_path = f"{path}/JPEGImages/{image_id}.jpg"
+        if not os.path.isfile(image_path):
+            raise Exception(f"Expected {image_path} to exist.")
         size = xml_root.find('size')
         segmented = xml_root.find('segmented').text == '1'
         segmented_path = None
@@ -65,7 +84,7 @@ class VOCIngestor(Ingestor):
                 'width': image_width,
                 'height': image_height
             },
-            'detections': [self._get_detection(node) for node in xml_root.findall('object')]
+            'detections': detections
         }
 
     def _get_detection(self, node):
@@ -105,6 +124,12 @@ class VOCEgestor(Egestor):
             'tvmonitor': []
         }
 
+    def index_file(self):
+        return 'VOC2012/ImageSets/Main/trainval.txt'
+
+    def image_format(self):
+        return 'jpeg'
+
     def egest(self, *, image_detections, root):
         image_sets_path = f"{root}/VOC2012/ImageSets/Main"
         images_path = f"{root}/VOC2012/JPEGImages"
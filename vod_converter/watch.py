@@ -0,0 +1,112 @@
+"""
+Continuously converts images whose annotations are added to or changed in a source dataset.
+
+Each poll indexes the source with `converter.Ingestor.watch_index` (a directory scan, no file contents are read)
+and converts the images whose annotations changed, and stayed unchanged for one poll interval so half written
+files are not picked up, with `converter.convert` into a staging directory within the output. The converted files
+are then moved into place, and only afterwards are new image ids appended to the output's index in a single
+write, so readers of the index never see an image whose files are missing.
+
+Images already listed in the output's index when watching starts are assumed to be up to date, unless their
+annotations were modified after the index was last written.
+
+Requires an ingestor implementing `converter.Ingestor.watch_index`, e.g KITTI or VOC, and an egestor with an
+`index_file`, e.g KITTI or VOC.
+"""
+import logging
+import os
+import shutil
+import tempfile
+import time
+
+import converter
+
+logger = logging.getLogger(__name__)
+
+
+def watch(*, from_path, ingestor, to_path, egestor, select_only_known_labels, filter_images_without_labels,
+          poll_interval=1.0, max_polls=None):
+    """
+    Watch from_path, converting new or changed images into to_path.
+
+    :param poll_interval: seconds between polls
+    :param max_polls: stop after this many polls, or never if None
+    :return: (success, message), if stopped
+    """
+    from_valid, from_msg = ingestor.validate(from_path)
+    if not from_valid:
+        return from_valid, from_msg
+    index_file = egestor.index_file()
+    if index_file is None:
+        return False, "Output format has no index file to append converted images to"
+
+    try:
+        initial_stamps = ingestor.watch_index(from_path)
+    except NotImplementedError:
+        return False, "Input format does not support watching for changed annotations"
+
+    index_path = f"{to_path}/{index_file}"
+    os.makedirs(os.path.dirname(index_path), exist_ok=True)
+    indexed_ids = set(converter.read_index(index_path))
+    indexed_at = os.stat(index_path).st_mtime_ns if indexed_ids else 0
+    converted_stamps = {image_id: initial_stamps[image_id] for image_id in indexed_ids
+                        if image_id in initial_stamps and initial_stamps[image_id][0] <= indexed_at}
+    pending_stamps = {}
+
+    polls = 0
+    while max_polls is None or polls < max_polls:
+        if polls:
+            time.sleep(poll_interval)
+        polls += 1
+
+        stamps = ingestor.watch_index(from_path)
+        changed = {image_id: stamp for image_id, stamp in stamps.items() if converted_stamps.get(image_id) != stamp}
+        ready = {image_id: stamp for image_id, stamp in changed.items() if pending_stamps.get(image_id) == stamp}
+        pending_stamps = changed
+        if not ready:
+            continue
+
+        logger.info(f"Converting {len(ready)} new or changed images")
+        try:
+            new_ids = _convert_images(
+                image_ids=set(ready), indexed_ids=indexed_ids, index_file=index_file,
+                from_path=from_path, ingestor=ingestor, to_path=to_path, egestor=egestor,
+                select_only_known_labels=select_only_known_labels,
+                filter_images_without_labels=filter_images_without_labels)
+        except Exception:
+            logger.exception("Failed to convert images, retrying on the next poll")
+            continue
+
+        converter.append_index(index_path, new_ids)
+        indexed_ids.update(new_ids)
+        converted_stamps.update(ready)
+        for image_id in ready:
+            del pending_stamps[image_id]
+        logger.info(f"Converted {len(ready)} images, {len(new_ids)} of them new")
+
+    return True, ''
+
+
+def _convert_images(*, image_ids, indexed_ids, index_file, from_path, ingestor, to_path, egestor,
+                    select_only_known_labels, filter_images_without_labels):
+    """
+    Convert images into to_path, leaving its index as it is.
+
+    :return: ids of converted images not yet in the index
+    """
+    staging_path = tempfile.mkdtemp(prefix='.watch-', dir=to_path)
+    try:
+        success, msg = converter.convert(
+            from_path=from_path, ingestor=ingestor, to_path=staging_path, egestor=egestor,
+            select_only_known_labels=select_only_known_labels,
+            filter_images_without_labels=filter_images_without_labels,
+            sampler=converter.Sampler(image_ids=image_ids))
+        if not success:
+            raise Exception(msg)
+
+        staged_index_path = os.path.join(staging_path, index_file)
+        converter.move_files(staging_path, to_path, exclude={staged_index_path})
+
+        return [image_id for image_id in converter.read_index(staged_index_path) if image_id not in indexed_ids]
+    finally:
+        shutil.rmtree(staging_path, ignore_errors=True)